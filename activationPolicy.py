@@ -0,0 +1,34 @@
+# CONSTANTS
+DEACTIVATION_TIME = 1.0
+CCD_MOTION_FRACTION = 0.5
+CCD_SWEPT_FRACTION = 0.4
+WAKE_MARGIN = 1.0
+
+
+class ActivationPolicy:
+    # Lets resting bodies fall asleep and wakes them again around destruction
+    # events. Bullet only runs CCD for a body whose motion in one step exceeds
+    # its motion threshold, so scaling that threshold with the block size
+    # limits sweeping to bodies that could actually tunnel through a neighbour.
+    def __init__(self, body_registry, spatial_index):
+        self.body_registry = body_registry
+        self.spatial_index = spatial_index
+
+    def configure(self, node, size, material_properties):
+        node.setLinearSleepThreshold(material_properties['linear_sleep'])
+        node.setAngularSleepThreshold(material_properties['angular_sleep'])
+        node.setDeactivationTime(DEACTIVATION_TIME)
+
+        node.setCcdMotionThreshold(size * CCD_MOTION_FRACTION)
+        node.setCcdSweptSphereRadius(size * CCD_SWEPT_FRACTION)
+
+    def wake_near(self, position, radius):
+        indices, _, _ = self.spatial_index.query_radius(position, radius + WAKE_MARGIN)
+        node_paths = self.spatial_index.node_paths
+        for index in indices:
+            node_paths[index].node().setActive(True, True)
+        return len(indices)
+
+    def wake_all(self):
+        for node_path in self.body_registry.dynamic_bodies():
+            node_path.node().setActive(True, True)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# CONSTANTS
+SEED = 1234
+SETTLE_STEPS = 60
+EVENT_STEPS = 240
+THRESHOLD = 10.0
+REPEATS = 5
+# Cached spatial index positions may lag the scene graph by float32 rounding only.
+INDEX_TOLERANCE = 1e-3
+GRID_SIDE = 30
+GRID_SIZE = 0.5
+MATERIALS = ('wood', 'stone', 'metal')
+EVENTS = ('wrecking_ball', 'heavy_ball', 'explosion', 'earthquake')
+# Metrics where a larger value is worse; these are the ones checked for regressions.
+REGRESSION_METRICS = ('startup_s', 'build_s', 'settle_ms_per_step', 'event_ms_per_step', 'event_overhead_ms', 'peak_rss_mb')
+# Changes smaller than this are timer and scheduler noise, whatever the percentage.
+NOISE_FLOORS = {
+    'startup_s': 0.05,
+    'build_s': 0.02,
+    'settle_ms_per_step': 0.1,
+    'event_ms_per_step': 0.1,
+    'event_overhead_ms': 1.0,
+    'peak_rss_mb': 5.0,
+}
+
+
+# Every scene is a list of (position, material, size) blocks centred on the
+# origin, so each event hits the structure the same way.
+def tower(width=3, height=20, material='stone'):
+    offset = (width - 1) / 2
+    return [((x - offset, y - offset, 0.5 + z), material, 1.0)
+            for z in range(height) for y in range(width) for x in range(width)]
+
+
+def wall(length=16, height=8, material='stone'):
+    offset = (length - 1) / 2
+    return [((x - offset + (z % 2) * 0.5, 0.0, 0.5 + z), material, 1.0)
+            for z in range(height) for x in range(length - z % 2)]
+
+
+def pyramid(base=10):
+    blocks = []
+    for z in range(base):
+        side = base - z
+        offset = (side - 1) / 2
+        material = MATERIALS[z % len(MATERIALS)]
+        blocks.extend(((x - offset, y - offset, 0.5 + z), material, 1.0) for y in range(side) for x in range(side))
+    return blocks
+
+
+def grid(count, side=GRID_SIDE, size=GRID_SIZE):
+    offset = (side - 1) / 2 * size
+    return [(((index % side) * size - offset, (index // side % side) * size - offset, (index // (side * side) + 0.5) * size),
+             MATERIALS[index % len(MATERIALS)], size) for index in range(count)]
+
+
+SCENES = {
+    'tower': tower,
+    'wall': wall,
+    'pyramid': pyramid,
+    'grid_1k': lambda: grid(1000),
+    'grid_5k': lambda: grid(5000),
+    'grid_20k': lambda: grid(20000),
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def trigger_event(sim, event, blocks, seed, event_steps):
+    top = max(position[2] for position, _, _ in blocks)
+    if event == 'wrecking_ball':
+        sim.add_wrecking_ball()
+    elif event == 'heavy_ball':
+        sim.drop_heavy_ball((0.0, 0.0, top), 5.0)
+    elif event == 'explosion':
+        sim.trigger_explosion((0.0, 0.0, 1.0), 200.0, 5.0)
+    elif event == 'earthquake':
+        sim.trigger_earthquake(10, event_steps * sim.step_size, seed)
+    else:
+        raise ValueError(f"unknown event '{event}'")
+
+
+def timed_steps(sim, steps):
+    start = time.perf_counter()
+    sim.step(steps)
+    return (time.perf_counter() - start) * 1000 / max(steps, 1)
+
+
+# Runs in a fresh process so startup time and peak RSS belong to this case
+# alone.
+def run_case(job):
+    scene, event, seed, settle_steps, event_steps = job
+    start = time.perf_counter()
+    from simulation import HeadlessSimulation
+    sim = HeadlessSimulation()
+    startup = time.perf_counter() - start
+
+    np.random.seed(seed)
+    blocks = SCENES[scene]()
+    start = time.perf_counter()
+    for position, material, size in blocks:
+        sim.add_block(position, 'cube', material, size)
+    build = time.perf_counter() - start
+
+    settle_ms = timed_steps(sim, settle_steps)
+    start = time.perf_counter()
+    trigger_event(sim, event, blocks, seed, event_steps)
+    overhead = time.perf_counter() - start
+    event_ms = timed_steps(sim, event_steps)
+    index_error = sim.spatial_index.max_error()
+
+    return {
+        'scene': scene,
+        'event': event,
+        'seed': seed,
+        'blocks': len(blocks),
+        'startup_s': startup,
+        'build_s': build,
+        'settle_ms_per_step': settle_ms,
+        'event_ms_per_step': event_ms,
+        'event_overhead_ms': overhead * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+        'index_error_m': index_error,
+    }
+
+
+def summarize(runs):
+    # Each metric is the median over the repeats; the individual samples are
+    # kept under 'runs' so a comparison can tell noise from a real change.
+    result = dict(runs[0])
+    result['repeats'] = len(runs)
+    result['index_error_m'] = max(run['index_error_m'] for run in runs)
+    result['runs'] = {metric: [run[metric] for run in runs] for metric in REGRESSION_METRICS}
+    for metric in REGRESSION_METRICS:
+        result[metric] = float(np.median(result['runs'][metric]))
+    return result
+
+
+def run_benchmarks(scenes, events, seed=SEED, settle_steps=SETTLE_STEPS, event_steps=EVENT_STEPS, repeats=REPEATS):
+    jobs = [(scene, event, seed, settle_steps, event_steps) for scene in scenes for event in events]
+    # One case at a time so cases do not compete for cores, each in its own
+    # process. The repeats of a case are interleaved with the other cases so
+    # a slow stretch on the machine does not land on one case only.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as pool:
+        results = list(pool.map(run_case, jobs * repeats))
+    runs = {}
+    for result in results:
+        runs.setdefault(f"{result['scene']}/{result['event']}", []).append(result)
+    return {case: summarize(case_runs) for case, case_runs in runs.items()}
+
+
+def environment():
+    import panda3d
+    return {
+        'python': platform.python_version(),
+        'panda3d': panda3d.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def find_regressions(results, baseline, threshold=THRESHOLD):
+    # A metric regresses when its median is more than threshold percent and
+    # more than its noise floor above the baseline median, and every new run
+    # is slower than every baseline run.
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            old = previous.get(metric)
+            if not old:
+                continue
+            new = result[metric]
+            change = (new - old) / old * 100
+            if change <= threshold or new - old <= NOISE_FLOORS[metric]:
+                continue
+            old_runs = previous.get('runs', {}).get(metric, [old])
+            new_runs = result.get('runs', {}).get(metric, [new])
+            if min(new_runs) <= max(old_runs):
+                continue
+            regressions.append((case, metric, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark canonical demolition scenes headlessly.')
+    parser.add_argument('--scene', action='append', choices=list(SCENES), help='scene to run (repeatable, default all)')
+    parser.add_argument('--event', action='append', choices=EVENTS, help='event to run (repeatable, default all)')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--settle-steps', type=int, default=SETTLE_STEPS)
+    parser.add_argument('--event-steps', type=int, default=EVENT_STEPS)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='regression threshold in percent')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='runs per case; metrics are the median')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scene or list(SCENES), args.event or list(EVENTS), args.seed,
+                             args.settle_steps, args.event_steps, args.repeats)
+    with open(args.output, 'w') as output_file:
+        json.dump({'environment': environment(), 'results': results}, output_file, indent=2)
+
+    for case, result in results.items():
+        print(f"{case:28} {result['blocks']:6d} blocks  {result['event_ms_per_step']:8.2f} ms/step  "
+              f"{result['event_overhead_ms']:8.2f} ms event  {result['peak_rss_mb']:7.1f} MB")
+    print(f"{len(results)} cases written to {args.output}")
+
+    # Every case doubles as a check that the spatial index re-read each body
+    # that moved during the event, including ones that fell asleep again.
+    stale = [(case, result['index_error_m']) for case, result in results.items()
+             if result['index_error_m'] > INDEX_TOLERANCE]
+    for case, error in stale:
+        print(f"STALE INDEX {case}: cached positions off by up to {error:.3f} m")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = find_regressions(results, baseline, args.threshold)
+        for case, metric, old, new, change in regressions:
+            print(f"REGRESSION {case} {metric}: {old:.3f} -> {new:.3f} (+{change:.1f}%)")
+        if regressions:
+            sys.exit(1)
+    if stale:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import numpy as np
+from panda3d.core import Point3
+
+# CONSTANTS
+BLAST_RAYS = 256
+MIN_EXPOSURE = 0.01
+DEFAULT_TRANSMISSION = 0.0
+
+
+def sphere_directions(count):
+    # Evenly spread unit vectors (Fibonacci sphere).
+    index = np.arange(count) + 0.5
+    z = 1.0 - 2.0 * index / count
+    radius = np.sqrt(1.0 - z * z)
+    theta = np.pi * (1.0 + 5.0 ** 0.5) * index
+    return np.stack([radius * np.cos(theta), radius * np.sin(theta), z], axis=1)
+
+
+class BlastModel:
+    # Works out how exposed each body is to a blast. A fixed fan of rays is
+    # cast from the centre with rayTestAll; along each ray the first body
+    # gets full exposure and every body behind it is attenuated by the
+    # blast_transmission of the materials in front. The ray count, not the
+    # body count, sets the cost. Exposures are computed once per blast and
+    # kept with any shockwave front, which releases the impulses shell by
+    # shell as it expands.
+    def __init__(self, main_app, rays=BLAST_RAYS):
+        self.main_app = main_app
+        self.directions = sphere_directions(rays)
+        self.fronts = []
+
+    def transmission_of(self, node):
+        registry = self.main_app.body_registry
+        slot = registry.slots.get(node)
+        if slot is None:
+            return DEFAULT_TRANSMISSION
+        return self.main_app.material_manager.table['blast_transmission'][registry.material_ids[slot]]
+
+    def couplings_of(self, nodes):
+        registry = self.main_app.body_registry
+        slots = registry.slots_of(nodes)
+        couplings = self.main_app.material_manager.table['blast_coupling'][registry.material_ids[np.maximum(slots, 0)]]
+        return np.where(slots >= 0, couplings, 1.0)
+
+    def cast(self, origin, radius):
+        # Returns the best exposure of every body a ray hit, plus a padded
+        # attenuation profile per ray: hit_distances[ray, k] is the distance
+        # of the k-th hit and attenuation[ray, k] the blast left before it.
+        physics_world = self.main_app.physics_world
+        exposure = {}
+        profiles = []
+        for end in (np.asarray(origin) + self.directions * radius).tolist():
+            result = physics_world.rayTestAll(origin, Point3(*end))
+            distances = []
+            remainders = [1.0]
+            for hit in sorted(result.getHits(), key=lambda hit: hit.getHitFraction()):
+                node = hit.getNode()
+                remaining = remainders[-1]
+                if remaining > exposure.get(node, 0.0):
+                    exposure[node] = remaining
+                distances.append(hit.getHitFraction() * radius)
+                remainders.append(remaining * self.transmission_of(node))
+                if remainders[-1] < MIN_EXPOSURE:
+                    break
+            profiles.append((distances, remainders))
+
+        width = max(len(distances) for distances, _ in profiles)
+        hit_distances = np.full((len(profiles), width), np.inf)
+        attenuation = np.empty((len(profiles), width + 1))
+        for ray, (distances, remainders) in enumerate(profiles):
+            hit_distances[ray, :len(distances)] = distances
+            attenuation[ray, :len(remainders)] = remainders
+            attenuation[ray, len(remainders):] = remainders[-1]
+        return exposure, hit_distances, attenuation
+
+    def exposure(self, position, radius, nodes, offsets):
+        # Bodies a ray hit directly use that exposure. Every other body reads
+        # the profile of the ray closest to its direction at the depth of its
+        # near face, so no body needs a ray of its own.
+        cast, hit_distances, attenuation = self.cast(Point3(position), radius)
+        distances = np.linalg.norm(offsets, axis=1)
+        rays = np.argmax((offsets / np.maximum(distances, 1e-9)[:, None]) @ self.directions.T, axis=1)
+        registry = self.main_app.body_registry
+        slots = registry.slots_of(nodes)
+        half_sizes = np.where(slots >= 0, registry.half_sizes[np.maximum(slots, 0)], 0.5)
+        in_front = (hit_distances[rays] < (distances - half_sizes)[:, None]).sum(axis=1)
+        exposures = attenuation[rays, in_front]
+
+        island_manager = self.main_app.island_manager
+        if island_manager.islands:
+            nodes = [island_manager.body_of(node) for node in nodes]
+        direct = np.fromiter((cast.get(node, -1.0) for node in nodes), dtype=np.float64, count=len(nodes))
+        return np.where(direct >= 0.0, direct, exposures)
+
+    def add_front(self, speed, nodes, distances, impulses):
+        order = np.argsort(distances)
+        self.fronts.append({
+            'speed': speed,
+            'elapsed': 0.0,
+            'next': 0,
+            'distances': distances[order],
+            'nodes': [nodes[index] for index in order],
+            'impulses': [impulses[index] for index in order],
+        })
+
+    def on_physics_step(self, dt):
+        if not self.fronts:
+            return
+        fronts = []
+        for front in self.fronts:
+            front['elapsed'] += dt
+            start = front['next']
+            end = int(np.searchsorted(front['distances'], front['speed'] * front['elapsed'], side='right'))
+            if end > start:
+                front['next'] = end
+                self.main_app.destruction_manager.apply_impulses(front['nodes'][start:end], front['impulses'][start:end])
+            if end < len(front['nodes']):
+                fronts.append(front)
+        self.fronts = fronts
+
+    def clear(self):
+        self.fronts = []
@@ -0,0 +1,170 @@
+import numpy as np
+
+# CONSTANTS
+INITIAL_SLOTS = 1024
+CATEGORIES = ('ground', 'block', 'wrecking_ball', 'anchor', 'heavy_ball', 'island', 'fragment')
+DYNAMIC_CATEGORIES = ('block', 'wrecking_ball', 'heavy_ball', 'fragment')
+RESETTABLE_CATEGORIES = ('block', 'wrecking_ball', 'anchor', 'heavy_ball', 'island', 'fragment')
+
+
+class BodyRegistry:
+    # Owns every rigid body, shape and constraint the simulation creates, so
+    # that lookups never scan render and teardown always detaches from Bullet.
+    def __init__(self, physics_world, spatial_index=None):
+        self.physics_world = physics_world
+        self.spatial_index = spatial_index
+
+        self.bodies = {category: {} for category in CATEGORIES}
+        self.categories = {}
+        self.shapes = {}
+        self.info = {}
+        self.constraints = {}
+        # Bumped on every register and unregister, so callers can tell that
+        # the set of bodies changed without comparing it.
+        self.version = 0
+
+        # Blocks and fragments also get a slot in flat per-body arrays so
+        # material lookups over many bodies are a single fancy index. Slots
+        # are reused after unregister; present marks the slots in use and a
+        # slot's generation goes up every time it is handed to a new body.
+        self.slots = {}
+        self.free_slots = []
+        self.slot_count = 0
+        self.material_ids = np.zeros(INITIAL_SLOTS, dtype=np.int16)
+        self.masses = np.zeros(INITIAL_SLOTS)
+        self.half_sizes = np.zeros(INITIAL_SLOTS)
+        self.present = np.zeros(INITIAL_SLOTS, dtype=bool)
+        self.generations = np.zeros(INITIAL_SLOTS, dtype=np.int64)
+        self.slot_nodes = np.zeros(INITIAL_SLOTS, dtype=object)
+        self.slot_paths = np.zeros(INITIAL_SLOTS, dtype=object)
+        self.slot_arrays = ('material_ids', 'masses', 'half_sizes', 'present', 'generations', 'slot_nodes', 'slot_paths')
+
+    def register(self, category, node_path, shape=None, info=None):
+        node = node_path.node()
+        self.version += 1
+        self.bodies[category][node] = node_path
+        self.categories[node] = category
+        if shape is not None:
+            self.shapes[node] = shape
+        if info is not None:
+            self.info[node] = info
+            if 'material_id' in info:
+                self.add_slot(node_path, info)
+        if self.spatial_index is not None and category in DYNAMIC_CATEGORIES:
+            self.spatial_index.add(node_path)
+        return node_path
+
+    def add_slot(self, node_path, info):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.slot_count
+            self.slot_count += 1
+            if slot == len(self.masses):
+                for name in self.slot_arrays:
+                    array = getattr(self, name)
+                    grown = np.zeros(slot * 2, dtype=array.dtype)
+                    grown[:slot] = array
+                    setattr(self, name, grown)
+        node = node_path.node()
+        self.slots[node] = slot
+        self.material_ids[slot] = info['material_id']
+        self.masses[slot] = info['mass']
+        self.half_sizes[slot] = info['size'] / 2
+        self.present[slot] = True
+        self.generations[slot] += 1
+        self.slot_nodes[slot] = node
+        self.slot_paths[slot] = node_path
+
+    def used_slots(self):
+        return np.flatnonzero(self.present[:self.slot_count])
+
+    def slots_of(self, nodes):
+        # -1 for bodies without a slot (balls, anchors, islands, ground).
+        slots = self.slots
+        return np.fromiter((slots.get(node, -1) for node in nodes), dtype=np.int64, count=len(nodes))
+
+    def masses_of(self, nodes):
+        # Registered masses, which stay valid while a body is held static,
+        # and the body's own mass for anything without a slot.
+        slots = self.slots_of(nodes)
+        masses = self.masses[np.maximum(slots, 0)]
+        for index in np.flatnonzero(slots < 0).tolist():
+            masses[index] = nodes[index].getMass()
+        return masses
+
+    def register_constraint(self, constraint, *node_paths):
+        self.constraints[constraint] = [node_path.node() for node_path in node_paths]
+        return constraint
+
+    def get(self, category):
+        return list(self.bodies[category].values())
+
+    def dynamic_bodies(self):
+        node_paths = []
+        for category in DYNAMIC_CATEGORIES:
+            node_paths.extend(self.bodies[category].values())
+        return node_paths
+
+    def category_of(self, node_path):
+        return self.categories.get(node_path.node())
+
+    def remove_constraint(self, constraint):
+        if self.constraints.pop(constraint, None) is not None:
+            self.physics_world.removeConstraint(constraint)
+
+    def unregister(self, node_path):
+        # Forgets a body without touching the world or scene graph, for
+        # callers such as the fragment pool that reuse the node.
+        node = node_path.node()
+        category = self.categories.pop(node, None)
+        if category is None:
+            return None
+
+        for constraint, nodes in list(self.constraints.items()):
+            if node in nodes:
+                self.remove_constraint(constraint)
+
+        self.version += 1
+        del self.bodies[category][node]
+        self.shapes.pop(node, None)
+        self.info.pop(node, None)
+        slot = self.slots.pop(node, None)
+        if slot is not None:
+            self.present[slot] = False
+            self.slot_nodes[slot] = 0
+            self.slot_paths[slot] = 0
+            self.free_slots.append(slot)
+        if self.spatial_index is not None:
+            self.spatial_index.remove(node_path)
+        return category
+
+    def remove(self, node_path):
+        if self.unregister(node_path) is None:
+            return
+        self.physics_world.removeRigidBody(node_path.node())
+        node_path.removeNode()
+
+    def clear(self, categories=RESETTABLE_CATEGORIES):
+        for category in categories:
+            for node_path in list(self.bodies[category].values()):
+                self.remove(node_path)
+
+    def teardown(self):
+        # Forgets every body and removes its node without detaching it from
+        # Bullet, for callers that replace the world: removeRigidBody is
+        # linear in the world size, so removing bodies one by one is
+        # quadratic in the scene size.
+        self.constraints = {}
+        for category in CATEGORIES:
+            for node_path in list(self.bodies[category].values()):
+                self.unregister(node_path)
+                node_path.removeNode()
+        self.free_slots = []
+        self.slot_count = 0
+
+    def reset(self):
+        self.clear(RESETTABLE_CATEGORIES)
+        if not self.slots:
+            self.free_slots = []
+            self.slot_count = 0
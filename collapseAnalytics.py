@@ -0,0 +1,242 @@
+import itertools
+import struct
+
+import numpy as np
+from panda3d.core import NodePath
+from panda3d.bullet import BulletRigidBodyNode
+
+# CONSTANTS
+SAMPLE_INTERVAL = 10
+LOG_MAGIC = b'DCAL'
+HEADER_FORMAT = '<4sIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+BUFFER_ROWS = 256
+DISPLACED_DISTANCE = 0.5
+SPREAD_PERCENTILE = 95
+FALL_LIMIT = -1.0
+# Settled once the structure's kinetic energy per kilogram stays below this
+# for SETTLE_SAMPLES samples in a row.
+SETTLE_ENERGY = 0.01
+SETTLE_SAMPLES = 3
+
+
+# A log is a 16-byte header (magic, version, column count, name length),
+# the comma-separated column names, then one float32 row per sample.
+def open_log(path):
+    with open(path, 'rb') as log_file:
+        magic, version, column_count, name_length = struct.unpack(HEADER_FORMAT, log_file.read(HEADER_SIZE))
+        if magic != LOG_MAGIC:
+            raise ValueError(f"{path} is not a collapse analytics log")
+        columns = log_file.read(name_length).decode('utf-8').split(',')
+    rows = np.memmap(path, dtype='<f4', mode='r', offset=HEADER_SIZE + name_length)
+    return columns, rows.reshape(-1, column_count)
+
+
+def read_vectors(vectors, count):
+    return np.fromiter(itertools.chain.from_iterable(vectors), dtype=np.float64, count=3 * count).reshape(count, 3)
+
+
+class CollapseAnalytics:
+    # Samples the blocks and fragments every SAMPLE_INTERVAL steps and
+    # reduces them with NumPy to kinetic energy (total and per material), the
+    # fraction of blocks displaced from where they stood at start(), the
+    # structure height, the debris spread around the original footprint and
+    # the time from the last destruction event until everything settled.
+    #
+    # Rows are the BodyRegistry's slots, so the registry keeps the row set
+    # up to date as bodies come and go and masses, sizes and materials are
+    # read straight from its arrays. Each sample only reads positions and
+    # velocities of awake bodies, and of bodies that took over a slot since
+    # the last sample; the activation check and every other per-body call
+    # runs through map() and np.fromiter without Python code per body.
+    # Bodies that fell below FALL_LIMIT count as displaced and drop out of
+    # the other metrics. Balls are left out so a swinging wrecking ball does
+    # not keep the structure from settling.
+    def __init__(self, main_app, interval=SAMPLE_INTERVAL, buffer_rows=BUFFER_ROWS):
+        self.main_app = main_app
+        self.interval = interval
+        self.buffer_rows = buffer_rows
+        self.running = False
+        self.steps = 0
+        self.materials = []
+        self.columns = []
+
+        self.positions = np.zeros((0, 3))
+        self.inertia = np.zeros((0, 3))
+        self.seen = np.zeros(0, dtype=np.int64)
+        self.placed = np.zeros((0, 3))
+        self.placed_generations = np.zeros(0, dtype=np.int64)
+        self.placed_count = 0
+        self.centroid = np.zeros(2)
+
+        self.event_time = None
+        self.settle_time = None
+        self.quiet_since = None
+        self.quiet_samples = 0
+        self.latest = {}
+
+        self.buffer = None
+        self.slot = 0
+        self.rows_written = 0
+        self.output = None
+
+    def start(self, path=None):
+        if self.running:
+            self.stop()
+        main_app = self.main_app
+        registry = main_app.body_registry
+        self.materials = list(main_app.material_manager.materials)
+        self.columns = (['time', 'kinetic_energy'] + [f'kinetic_energy_{material}' for material in self.materials]
+                        + ['displaced_fraction', 'height', 'spread', 'settle_time', 'active'])
+
+        capacity = len(registry.masses)
+        self.positions = np.zeros((capacity, 3))
+        self.inertia = np.zeros((capacity, 3))
+        self.seen = np.zeros(capacity, dtype=np.int64)
+        self.placed = np.zeros((capacity, 3))
+        self.placed_generations = np.zeros(capacity, dtype=np.int64)
+        present = registry.used_slots()
+        self.track(present)
+        blocks = present[np.fromiter(map(registry.bodies['block'].__contains__, registry.slot_nodes[present]),
+                                     dtype=bool, count=len(present))]
+        self.placed[blocks] = self.positions[blocks]
+        self.placed_generations[blocks] = registry.generations[blocks]
+        self.placed_count = len(blocks)
+        self.centroid = self.placed[blocks, :2].mean(axis=0) if self.placed_count else np.zeros(2)
+
+        self.event_time = None
+        self.settle_time = None
+        self.quiet_since = None
+        self.quiet_samples = 0
+        self.steps = 0
+
+        self.buffer = np.zeros((self.buffer_rows, len(self.columns)), dtype='<f4')
+        self.slot = 0
+        self.rows_written = 0
+        if path is not None:
+            names = ','.join(self.columns).encode('utf-8')
+            self.output = open(path, 'wb')
+            self.output.write(struct.pack(HEADER_FORMAT, LOG_MAGIC, 1, len(self.columns), len(names)))
+            self.output.write(names)
+        self.running = True
+        self.sample()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.flush()
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+        self.running = False
+
+    def mark_event(self):
+        if not self.running:
+            return
+        self.event_time = self.main_app.stepper.sim_time
+        self.settle_time = None
+        self.quiet_since = None
+        self.quiet_samples = 0
+
+    def grow(self):
+        capacity = len(self.main_app.body_registry.masses)
+        if len(self.seen) >= capacity:
+            return
+        for name in ('positions', 'inertia', 'seen', 'placed', 'placed_generations'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def track(self, slots):
+        # Rows handed to a new body since the last sample: cache its inertia.
+        registry = self.main_app.body_registry
+        self.inertia[slots] = read_vectors(map(BulletRigidBodyNode.getInertia, registry.slot_nodes[slots]), len(slots))
+        self.seen[slots] = registry.generations[slots]
+        self.read_positions(slots)
+
+    def read_positions(self, slots):
+        paths = self.main_app.body_registry.slot_paths[slots]
+        self.positions[slots] = read_vectors(map(NodePath.getPos, paths, itertools.repeat(self.main_app.render)),
+                                             len(slots))
+
+    def on_physics_step(self, dt):
+        if not self.running:
+            return
+        self.steps += 1
+        if self.steps % self.interval == 0:
+            self.sample()
+
+    def sample(self):
+        main_app = self.main_app
+        registry = main_app.body_registry
+        owner = main_app.island_manager.owner
+        self.grow()
+
+        present = registry.used_slots()
+        new = self.seen[present] != registry.generations[present]
+        if new.any():
+            self.track(present[new])
+
+        # Island members follow the activation and velocity of their island.
+        nodes = registry.slot_nodes[present]
+        bodies = list(map(owner.get, nodes, nodes)) if owner else list(nodes)
+        awake = np.fromiter(map(BulletRigidBodyNode.isActive, bodies), dtype=bool, count=len(bodies))
+        moving = present[awake & ~new]
+        if len(moving):
+            self.read_positions(moving)
+        moving = present[awake]
+        moving_bodies = list(itertools.compress(bodies, awake))
+
+        positions = self.positions[present]
+        kept = positions[:, 2] >= FALL_LIMIT
+        current = positions[kept]
+        half_sizes = registry.half_sizes[present]
+
+        energies = np.zeros(len(self.materials))
+        awake_count = 0
+        if len(moving):
+            velocities = read_vectors(map(BulletRigidBodyNode.getLinearVelocity, moving_bodies), len(moving))
+            spins = read_vectors(map(BulletRigidBodyNode.getAngularVelocity, moving_bodies), len(moving))
+            on_site = self.positions[moving, 2] >= FALL_LIMIT
+            energy = (0.5 * registry.masses[moving] * np.einsum('ij,ij->i', velocities, velocities)
+                      + 0.5 * np.einsum('ij,ij,ij->i', self.inertia[moving], spins, spins)) * on_site
+            energies = np.bincount(registry.material_ids[moving].astype(np.int64), weights=energy,
+                                   minlength=len(self.materials))
+            awake_count = int(on_site.sum())
+        kinetic_energy = float(energies.sum())
+        total_mass = float(registry.masses[present][kept].sum())
+
+        was_placed = (self.placed_generations[present] == registry.generations[present]) & kept
+        placed_slots = present[was_placed]
+        moved = np.linalg.norm(self.positions[placed_slots] - self.placed[placed_slots], axis=1) > DISPLACED_DISTANCE
+        displaced = self.placed_count - len(placed_slots) + int(moved.sum())
+        displaced_fraction = displaced / self.placed_count if self.placed_count else 0.0
+        height = float((current[:, 2] + half_sizes[kept]).max()) if len(current) else 0.0
+        spread = (float(np.percentile(np.linalg.norm(current[:, :2] - self.centroid, axis=1), SPREAD_PERCENTILE))
+                  if len(current) else 0.0)
+
+        now = main_app.stepper.sim_time
+        if self.event_time is not None and self.settle_time is None:
+            if kinetic_energy <= SETTLE_ENERGY * max(total_mass, 1e-9):
+                if self.quiet_samples == 0:
+                    self.quiet_since = now
+                self.quiet_samples += 1
+                if self.quiet_samples >= SETTLE_SAMPLES:
+                    self.settle_time = self.quiet_since - self.event_time
+            else:
+                self.quiet_samples = 0
+
+        row = ([now, kinetic_energy] + energies.tolist()
+               + [displaced_fraction, height, spread, np.nan if self.settle_time is None else self.settle_time, awake_count])
+        self.latest = dict(zip(self.columns, row))
+        self.buffer[self.slot] = row
+        self.slot += 1
+        if self.slot == self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if self.slot and self.output is not None:
+            self.buffer[:self.slot].tofile(self.output)
+            self.rows_written += self.slot
+        self.slot = 0
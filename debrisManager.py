@@ -0,0 +1,181 @@
+import math
+
+# CONSTANTS
+CHECK_INTERVAL = 0.5
+WORLD_HALF_EXTENT = 30.0
+WORLD_FLOOR = -20.0
+MAX_BODIES = 2000
+FAR_DISTANCE = 15.0
+ACTION_MEMORY = 10.0
+FREEZE_TIME = 3.0
+DESPAWN_TIME = 20.0
+DEBRIS_CATEGORIES = ('fragment', 'heavy_ball', 'wrecking_ball')
+FREEZE_CATEGORIES = ('heavy_ball', 'wrecking_ball')
+
+
+class DebrisManager:
+    # Keeps long sessions at a flat cost. Every CHECK_INTERVAL it culls
+    # dynamic bodies and structure islands outside the world bounds, freezes
+    # balls that have rested far from every recent action by making them
+    # static (mass 0), despawns them after DESPAWN_TIME frozen, and evicts the
+    # least recently active debris while the world holds more than
+    # max_bodies. Only debris counts against that budget, since user-built
+    # blocks are never evicted (only the bounds check removes them), and
+    # debris close to a recent action is left alone so a freshly spawned ball
+    # survives to hit its target.
+    # Resting fragments are already returned to their pool by the
+    # FractureManager.
+    def __init__(self, main_app, max_bodies=MAX_BODIES):
+        self.main_app = main_app
+        self.enabled = False
+        self.max_bodies = max_bodies
+        self.elapsed = 0.0
+        self.actions = []
+        self.last_active = {}
+        self.frozen = {}
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.thaw_all()
+
+    def mark_action(self, position=None):
+        # position None (an earthquake) counts as action everywhere.
+        now = self.main_app.stepper.sim_time
+        self.actions = [action for action in self.actions if now - action[1] < ACTION_MEMORY]
+        self.actions.append((position, now))
+        for node in list(self.frozen):
+            node_path = self.frozen[node][0]
+            if position is None or (node_path.getPos(self.main_app.render) - position).length() < FAR_DISTANCE:
+                self.thaw(node)
+
+    def is_far(self, position, now):
+        for action_position, time in self.actions:
+            if now - time >= ACTION_MEMORY:
+                continue
+            if action_position is None or (position - action_position).length() < FAR_DISTANCE:
+                return False
+        return True
+
+    def in_bounds(self, position):
+        return (abs(position.getX()) <= WORLD_HALF_EXTENT and abs(position.getY()) <= WORLD_HALF_EXTENT
+                and position.getZ() >= WORLD_FLOOR)
+
+    def on_physics_step(self, dt):
+        if not self.enabled:
+            return
+        self.elapsed += dt
+        if self.elapsed < CHECK_INTERVAL:
+            return
+        self.elapsed = 0.0
+        self.update()
+
+    def update(self):
+        main_app = self.main_app
+        registry = main_app.body_registry
+        owner = main_app.island_manager.owner
+        render = main_app.render
+        now = main_app.stepper.sim_time
+
+        culled = []
+        last_active = {}
+        for node_path in registry.dynamic_bodies():
+            node = node_path.node()
+            if node in owner:
+                continue
+            position = node_path.getPos(render)
+            if not self.in_bounds(position):
+                culled.append(node_path)
+                continue
+            category = registry.categories[node]
+            if category not in DEBRIS_CATEGORIES:
+                continue
+
+            last_active[node] = now if node.isActive() else self.last_active.get(node, now)
+            if category not in FREEZE_CATEGORIES:
+                continue
+            frozen = self.frozen.get(node)
+            if frozen is not None:
+                if now - frozen[2] >= DESPAWN_TIME:
+                    culled.append(node_path)
+            elif now - last_active[node] >= FREEZE_TIME and self.is_far(position, now):
+                self.freeze(node, node_path, now)
+
+        # Island members follow their island, which is checked as a whole.
+        for island_np, _ in main_app.island_manager.islands.values():
+            if not self.in_bounds(island_np.getPos(render)):
+                culled.append(island_np)
+
+        self.last_active = last_active
+        for node_path in culled:
+            self.despawn(node_path)
+        self.enforce_budget()
+
+    def freeze(self, node, node_path, now):
+        self.frozen[node] = (node_path, node.getMass(), now)
+        node.setMass(0)
+
+    def thaw(self, node):
+        node_path, mass, _ = self.frozen.pop(node)
+        if not node_path.isEmpty():
+            node.setMass(mass)
+            node.setActive(True, True)
+        self.last_active[node] = self.main_app.stepper.sim_time
+
+    def thaw_all(self):
+        for node in list(self.frozen):
+            self.thaw(node)
+
+    def despawn(self, node_path):
+        main_app = self.main_app
+        registry = main_app.body_registry
+        node = node_path.node()
+        if node in self.frozen:
+            self.thaw(node)
+        self.last_active.pop(node, None)
+
+        category = registry.category_of(node_path)
+        if category == 'island':
+            main_app.island_manager.remove(node)
+            main_app.occupancy_grid.mark_dirty()
+            return
+        if category == 'fragment':
+            main_app.fracture_manager.release(node)
+            return
+        if category == 'wrecking_ball':
+            anchors = registry.bodies['anchor']
+            for nodes in list(registry.constraints.values()):
+                if node in nodes:
+                    for other in nodes:
+                        if other in anchors:
+                            registry.remove(anchors[other])
+        registry.remove(node_path)
+        if category == 'block':
+            main_app.occupancy_grid.mark_dirty()
+
+    def enforce_budget(self):
+        main_app = self.main_app
+        physics_world = main_app.physics_world
+        if physics_world.getNumRigidBodies() <= self.max_bodies:
+            return
+
+        registry = main_app.body_registry
+        debris = []
+        for category in DEBRIS_CATEGORIES:
+            debris.extend(registry.bodies[category].values())
+        fixed = physics_world.getNumRigidBodies() - len(debris)
+        excess = len(debris) - max(self.max_bodies - fixed, 0)
+        if excess <= 0:
+            return
+
+        render = main_app.render
+        now = main_app.stepper.sim_time
+        evictable = [node_path for node_path in debris if self.is_far(node_path.getPos(render), now)]
+        evictable.sort(key=lambda node_path: self.last_active.get(node_path.node(), -math.inf))
+        for node_path in evictable[:excess]:
+            self.despawn(node_path)
+
+    def clear(self):
+        self.actions = []
+        self.last_active = {}
+        self.frozen = {}
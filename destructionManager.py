@@ -1,7 +1,8 @@
 from panda3d.core import Vec3, LPoint3f
-from panda3d.bullet import BulletSphericalConstraint, BulletRigidBodyNode, BulletBoxShape, BulletSphereShape
+from panda3d.bullet import BulletSphericalConstraint, BulletRigidBodyNode
 import numpy as np
-from direct.task import Task
+
+import blastModel
 
 class DestructionManager:
     def __init__(self, main_app):
@@ -9,9 +10,11 @@ class DestructionManager:
 
     def add_wrecking_ball(self):
         main_app = self.main_app
+        if main_app.physics_thread.defer(self.add_wrecking_ball):
+            return
 
         ball_radius = 2.0
-        ball_shape = BulletSphereShape(ball_radius)
+        ball_shape = main_app.prototype_cache.get_shape('sphere', ball_radius * 2)
         ball_node = BulletRigidBodyNode('WreckingBall')
         ball_node.setMass(50.0)
         ball_node.addShape(ball_shape)
@@ -19,17 +22,16 @@ class DestructionManager:
         ball_node.setRestitution(0.2)
         ball_node.setLinearDamping(0.1)
         ball_node.setAngularDamping(0.1)
+        ball_node.notifyCollisions(True)
 
         ball_np = main_app.render.attachNewNode(ball_node)
         ball_np.setPos(0, 0, 3)
         main_app.physics_world.attachRigidBody(ball_node)
+        main_app.body_registry.register('wrecking_ball', ball_np, ball_shape)
 
-        model = main_app.loader.loadModel('models/misc/sphere')
-        model.setScale(ball_radius / 2)
-        model.setColor(0.5, 0.5, 0.5, 1)
-        model.reparentTo(ball_np)
+        main_app.prototype_cache.instance_model('sphere', ball_np, ball_radius / 2, (0.5, 0.5, 0.5, 1))
 
-        anchor_shape = BulletBoxShape(Vec3(0.1, 0.1, 0.1))
+        anchor_shape = main_app.prototype_cache.get_shape('cube', 0.2)
         anchor_node = BulletRigidBodyNode('Anchor')
         anchor_node.addShape(anchor_shape)
         anchor_node.setMass(0)
@@ -37,6 +39,7 @@ class DestructionManager:
         anchor_np.setPos(0, 0, 10) 
 
         main_app.physics_world.attachRigidBody(anchor_node)
+        main_app.body_registry.register('anchor', anchor_np, anchor_shape)
 
         constraint = BulletSphericalConstraint(anchor_node, ball_node, LPoint3f(0, 0, 0), LPoint3f(0, 0, 0))
         constraint.setPivotA(LPoint3f(0, 0, 0))
@@ -45,37 +48,83 @@ class DestructionManager:
         constraint.setDebugDrawSize(2.0)
 
         main_app.physics_world.attachConstraint(constraint)
+        main_app.body_registry.register_constraint(constraint, anchor_np, ball_np)
+
+        main_app.activation_policy.wake_near(anchor_np.getPos(), 5 + ball_radius)
+        main_app.debris_manager.mark_action(ball_np.getPos())
+        main_app.collapse_analytics.mark_event()
+        main_app.region_of_interest.activate(ball_np.getPos(), 5 + ball_radius)
+        main_app.render_batcher.refresh()
 
         ball_node.applyCentralImpulse(Vec3(50, 0, 0))
 
-    def trigger_explosion(self, position, force, radius):
+    def trigger_explosion(self, position, force, radius, shockwave_speed=None):
         main_app = self.main_app
+        if main_app.physics_thread.defer(self.trigger_explosion, position, force, radius, shockwave_speed):
+            return
 
         if not main_app.physics_enabled:
             return
 
-        for node in main_app.render.getChildren():
-            if node.node().isOfType(BulletRigidBodyNode.getClassType()):
-                node_position = node.getPos()
-                distance_vector = node_position - position
-                distance = np.linalg.norm([distance_vector.getX(), distance_vector.getY(), distance_vector.getZ()])
-
-                if distance < radius:
-                    if distance == 0:
-                        direction = Vec3(1, 0, 0)
-                    else:
-                        direction = distance_vector / distance
-                    
-                    impulse_magnitude = force / (distance + 0.1)
-                    impulse = direction * impulse_magnitude
-                    
-                    node.node().applyCentralImpulse(impulse)
-
-    def drop_heavy_ball(self, position):
+        main_app.particle_system.emit_explosion(position, radius)
+
+        spatial_index = main_app.spatial_index
+        indices, offsets, distances = spatial_index.query_radius(position, radius)
+        if len(indices) == 0:
+            return
+
+        nodes = [spatial_index.node_paths[index].node() for index in indices]
+        blast_model = main_app.blast_model
+        exposures = blast_model.exposure(position, radius, nodes, offsets)
+
+        # Fully shielded bodies get no impulse at all.
+        exposed = np.flatnonzero(exposures >= blastModel.MIN_EXPOSURE)
+        nodes = [nodes[index] for index in exposed]
+        offsets = offsets[exposed]
+        distances = distances[exposed]
+        couplings = blast_model.couplings_of(nodes)
+
+        directions = np.tile(np.array([1.0, 0.0, 0.0]), (len(nodes), 1))
+        nonzero = distances > 0
+        directions[nonzero] = offsets[nonzero] / distances[nonzero, None]
+        impulses = directions * (force / (distances + 0.1) * exposures[exposed] * couplings)[:, None]
+        impulses = [Vec3(*impulse) for impulse in impulses.tolist()]
+
+        main_app.region_of_interest.activate(position, radius)
+        main_app.activation_policy.wake_near(position, radius)
+        main_app.debris_manager.mark_action(position)
+        main_app.collapse_analytics.mark_event()
+
+        if shockwave_speed:
+            blast_model.add_front(shockwave_speed, nodes, distances, impulses)
+        else:
+            self.apply_impulses(nodes, impulses)
+
+    def apply_impulses(self, nodes, impulses):
+        main_app = self.main_app
+        # Bodies can be fractured or despawned before a delayed front arrives.
+        categories = main_app.body_registry.categories
+        live = [index for index, node in enumerate(nodes) if node in categories]
+        if not live:
+            return
+
+        nodes = [nodes[index] for index in live]
+        impulses = [impulses[index] for index in live]
+        nodes, impulses = main_app.island_manager.disturb(nodes, impulses)
+        nodes, impulses = main_app.fracture_manager.disturb(nodes, impulses)
+        for node, impulse in zip(nodes, impulses):
+            node.setActive(True, True)
+            node.applyCentralImpulse(impulse)
+
+        main_app.render_batcher.refresh()
+
+    def drop_heavy_ball(self, position, height=10.0):
         main_app = self.main_app
+        if main_app.physics_thread.defer(self.drop_heavy_ball, position, height):
+            return
 
         ball_radius = 1.0
-        ball_shape = BulletSphereShape(ball_radius)
+        ball_shape = main_app.prototype_cache.get_shape('sphere', ball_radius * 2)
         ball_node = BulletRigidBodyNode('HeavyBall')
         ball_node.setMass(100.0)
         ball_node.addShape(ball_shape)
@@ -83,37 +132,31 @@ class DestructionManager:
         ball_node.setRestitution(0.6)
         ball_node.setLinearDamping(0.1)
         ball_node.setAngularDamping(0.1)
+        ball_node.notifyCollisions(True)
 
         ball_np = main_app.render.attachNewNode(ball_node)
-        ball_np.setPos(position + Vec3(0, 0, 10))
+        ball_np.setPos(position + Vec3(0, 0, height))
         main_app.physics_world.attachRigidBody(ball_node)
+        main_app.body_registry.register('heavy_ball', ball_np, ball_shape)
 
-        model = main_app.loader.loadModel('models/misc/sphere')
-        model.setScale(ball_radius)
-        model.setColor(0.7, 0.2, 0.2, 1)
-        model.reparentTo(ball_np)
+        main_app.prototype_cache.instance_model('sphere', ball_np, ball_radius, (0.7, 0.2, 0.2, 1))
 
-    def trigger_earthquake(self):
-        main_app = self.main_app
+        main_app.region_of_interest.activate(position, ball_radius * 2)
+        main_app.activation_policy.wake_near(position, ball_radius * 2)
+        main_app.debris_manager.mark_action(position)
+        main_app.collapse_analytics.mark_event()
+        main_app.render_batcher.refresh()
 
-        def apply_earthquake(task):
-            magnitude = 10
-            duration = 5
-            elapsed = task.time
-            
-            if elapsed > duration:
-                main_app.placing_mode = 'building'
-                return Task.done
-
-            for node in main_app.render.getChildren():
-                if node.node().isOfType(BulletRigidBodyNode.getClassType()):
-                    impulse = Vec3(
-                        np.random.uniform(-1, 1),
-                        np.random.uniform(-1, 1),
-                        0
-                    ) * magnitude
-                    node.node().applyCentralImpulse(impulse)
-            return Task.cont
+    def trigger_earthquake(self, magnitude=10, duration=5, seed=None, mode='ground'):
+        main_app = self.main_app
+        if main_app.physics_thread.defer(self.trigger_earthquake, magnitude, duration, seed, mode):
+            return
 
+        motion = main_app.earthquake.start(magnitude, duration, seed, mode)
+        main_app.island_manager.disturb_all(motion.peak_velocity)
+        main_app.activation_policy.wake_all()
+        main_app.debris_manager.mark_action()
+        main_app.collapse_analytics.mark_event()
+        main_app.region_of_interest.activate()
+        main_app.render_batcher.refresh()
         main_app.placing_mode = 'earthquake'
-        main_app.taskMgr.add(apply_earthquake, "earthquakeTask")
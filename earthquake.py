@@ -0,0 +1,129 @@
+import numpy as np
+from panda3d.core import Vec3
+
+# CONSTANTS
+AMPLITUDE_PER_MAGNITUDE = 0.02
+FREQUENCY_RANGE = (0.5, 5.0)
+SPECTRUM_SLOPE = 1.0
+COMPONENTS = 16
+RISE_FRACTION = 0.1
+DECAY_FRACTION = 0.4
+
+
+class GroundMotion:
+    # Seeded horizontal ground displacement: a sum of sinusoids with random
+    # phases and directions, weighted by f ** -spectrum_slope inside
+    # frequency_range, shaped by a rise / hold / decay envelope and scaled so
+    # the peak displacement equals amplitude. The whole series is sampled
+    # once at the physics step so playback is a table lookup.
+    def __init__(self, amplitude, duration, step_size, seed=None, frequency_range=FREQUENCY_RANGE,
+                 spectrum_slope=SPECTRUM_SLOPE, components=COMPONENTS,
+                 rise_fraction=RISE_FRACTION, decay_fraction=DECAY_FRACTION):
+        self.duration = duration
+        self.step_size = step_size
+        rng = np.random.default_rng(seed)
+
+        frequencies = rng.uniform(frequency_range[0], frequency_range[1], components)
+        weights = frequencies ** -spectrum_slope
+        phases = rng.uniform(0.0, 2.0 * np.pi, components)
+        angles = rng.uniform(0.0, 2.0 * np.pi, components)
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+        self.times = np.arange(0.0, duration + step_size, step_size)
+        waves = np.sin(2.0 * np.pi * np.outer(self.times, frequencies) + phases) * weights
+        displacement = waves @ directions
+
+        envelope = np.ones_like(self.times)
+        rise = max(rise_fraction * duration, step_size)
+        decay = max(decay_fraction * duration, step_size)
+        envelope = np.minimum(envelope, self.times / rise)
+        envelope = np.minimum(envelope, (duration - self.times) / decay)
+        envelope = np.clip(envelope, 0.0, 1.0) ** 2
+        displacement *= envelope[:, None]
+
+        peak = np.abs(displacement).max()
+        if peak > 0:
+            displacement *= amplitude / peak
+
+        self.displacement = displacement
+        self.velocity = np.gradient(displacement, step_size, axis=0)
+        self.acceleration = np.gradient(self.velocity, step_size, axis=0)
+        self.peak_velocity = float(np.linalg.norm(self.velocity, axis=1).max())
+
+    def sample(self, time):
+        return min(int(round(time / self.step_size)), len(self.times) - 1)
+
+
+class EarthquakeEngine:
+    # Plays a GroundMotion either by moving the ground as a kinematic body
+    # (mode 'ground'; Bullet turns the motion into friction and contact forces)
+    # or by applying the equivalent inertial impulse -m * a * dt to every
+    # dynamic body from one NumPy array (mode 'impulse'). Both run once per
+    # physics step from the stepper callback.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.motion = None
+        self.mode = 'ground'
+        self.elapsed = 0.0
+        self.ground_np = None
+        self.ground_origin = None
+        self.node_paths = []
+        self.masses = None
+
+    @property
+    def active(self):
+        return self.motion is not None
+
+    def start(self, magnitude=10, duration=5, seed=None, mode='ground'):
+        main_app = self.main_app
+        if self.active:
+            self.stop()
+        if seed is None:
+            seed = int(np.random.randint(0, 2 ** 31 - 1))
+
+        self.motion = GroundMotion(magnitude * AMPLITUDE_PER_MAGNITUDE, duration, main_app.stepper.step_size, seed)
+        self.mode = mode
+        self.elapsed = 0.0
+
+        if mode == 'ground':
+            self.ground_np = main_app.body_registry.get('ground')[0]
+            self.ground_origin = self.ground_np.getPos()
+            self.ground_np.node().setKinematic(True)
+            self.ground_np.node().setDeactivationEnabled(False)
+        else:
+            self.node_paths = main_app.body_registry.dynamic_bodies()
+            self.masses = main_app.body_registry.masses_of([node_path.node() for node_path in self.node_paths])
+        return self.motion
+
+    def stop(self):
+        if not self.active:
+            return
+        if self.mode == 'ground':
+            self.ground_np.setPos(self.ground_origin)
+            self.ground_np.node().setKinematic(False)
+            self.ground_np = None
+        self.motion = None
+        self.node_paths = []
+        self.masses = None
+        if self.main_app.placing_mode == 'earthquake':
+            self.main_app.placing_mode = 'building'
+
+    def on_physics_step(self, dt):
+        if not self.active:
+            return
+
+        self.elapsed += dt
+        if self.elapsed > self.motion.duration:
+            self.stop()
+            return
+
+        index = self.motion.sample(self.elapsed)
+        if self.mode == 'ground':
+            x, y = self.motion.displacement[index]
+            self.ground_np.setPos(self.ground_origin + Vec3(x, y, 0))
+        else:
+            acceleration = self.motion.acceleration[index]
+            impulses = -self.masses[:, None] * acceleration[None, :] * dt
+            for node_path, (x, y) in zip(self.node_paths, impulses.tolist()):
+                if not node_path.isEmpty():
+                    node_path.node().applyCentralImpulse(Vec3(x, y, 0))
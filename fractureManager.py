@@ -0,0 +1,190 @@
+import itertools
+
+from panda3d.core import Vec3
+
+# CONSTANTS
+DIVISIONS = 2
+MAX_FRAGMENTS = 400
+SETTLE_TIME = 2.0
+FALL_LIMIT = -20.0
+
+
+class FractureTemplate:
+    # Pre-fractured layout for one (shape, size): the local centres of the
+    # DIVISIONS ** 3 sub-cubes of the block's bounding cube that fall inside
+    # the shape. Every fragment is a cube of fragment_size.
+    def __init__(self, shape_type, size, divisions=DIVISIONS):
+        self.fragment_size = size / divisions
+        self.offsets = []
+        for i, j, k in itertools.product(range(divisions), repeat=3):
+            offset = Vec3(i + 0.5, j + 0.5, k + 0.5) * self.fragment_size - Vec3(size / 2, size / 2, size / 2)
+            if self.contains(shape_type, size, offset):
+                self.offsets.append(offset)
+
+    def contains(self, shape_type, size, offset):
+        if shape_type == 'sphere':
+            return offset.length() <= size / 2
+        if shape_type == 'cone':
+            radius = size / 2 * (0.5 - offset.getZ() / size)
+            return offset.getXy().length() <= radius
+        return True
+
+
+class FractureManager:
+    # Breaks blocks whose contact or explosion impulse exceeds the strength of
+    # their material into fragments laid out by a cached FractureTemplate.
+    # Fragment bodies come from a pool keyed by (material, fragment size) and
+    # go back to it once they have been asleep for SETTLE_TIME or have fallen
+    # off the ground, so repeated blasts reuse the same nodes and the fragment
+    # count stays bounded.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.enabled = False
+        self.templates = {}
+        self.pool = {}
+        self.fragments = {}
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def get_template(self, shape_type, size):
+        key = (shape_type, size)
+        template = self.templates.get(key)
+        if template is None:
+            template = FractureTemplate(shape_type, size)
+            self.templates[key] = template
+        return template
+
+    def strength_of(self, info):
+        material_manager = self.main_app.material_manager
+        return material_manager.get_material_properties(info['material'], info['size'], info['shape_type'])['strength']
+
+    def acquire(self, material, fragment_size):
+        key = (material, fragment_size)
+        free = self.pool.get(key)
+        if free:
+            return free.pop()
+        return self.main_app.make_block('cube', material, fragment_size)
+
+    def release(self, node):
+        main_app = self.main_app
+        node_path, shape, info, _ = self.fragments.pop(node)
+        main_app.body_registry.unregister(node_path)
+        main_app.physics_world.removeRigidBody(node)
+        node_path.detachNode()
+        self.pool.setdefault((info['material'], info['size']), []).append((node_path, shape, info))
+
+    def fracture(self, node_path, impulse=None):
+        main_app = self.main_app
+        registry = main_app.body_registry
+        node = node_path.node()
+        info = registry.info[node]
+        template = self.get_template(info['shape_type'], info['size'])
+        count = len(template.offsets)
+        if count == 0 or len(self.fragments) + count > MAX_FRAGMENTS:
+            return None
+
+        main_app.region_of_interest.release(node)
+        transform = node_path.getNetTransform()
+        position = transform.getPos()
+        quat = transform.getQuat()
+        linear_velocity = node.getLinearVelocity()
+        angular_velocity = node.getAngularVelocity()
+        mass = node.getMass() / count
+        registry.remove(node_path)
+
+        render = main_app.render
+        fragments = []
+        for offset in template.offsets:
+            fragment_np, shape, fragment_info = self.acquire(info['material'], template.fragment_size)
+            fragment_node = fragment_np.node()
+            offset = quat.xform(offset)
+            fragment_np.reparentTo(render)
+            fragment_np.setPosQuat(position + offset, quat)
+            fragment_node.setMass(mass)
+            fragment_node.clearForces()
+            fragment_node.setLinearVelocity(linear_velocity + angular_velocity.cross(offset))
+            fragment_node.setAngularVelocity(angular_velocity)
+            main_app.physics_world.attachRigidBody(fragment_node)
+            registry.register('fragment', fragment_np, shape, fragment_info)
+            registry.masses[registry.slots[fragment_node]] = mass
+            fragment_node.setActive(True, True)
+            self.fragments[fragment_node] = [fragment_np, shape, fragment_info, 0.0]
+            fragments.append((fragment_node, impulse / count if impulse is not None else None))
+        return fragments
+
+    def disturb(self, nodes, impulses):
+        # Same contract as IslandManager.disturb: blocks hit harder than their
+        # strength are replaced by fragments that share the impulse.
+        if not self.enabled:
+            return nodes, impulses
+
+        registry = self.main_app.body_registry
+        blocks = registry.bodies['block']
+        free_nodes = []
+        free_impulses = []
+        for node, impulse in zip(nodes, impulses):
+            fragments = None
+            if node in blocks and impulse.length() > self.strength_of(registry.info[node]):
+                fragments = self.fracture(blocks[node], impulse)
+            if fragments is None:
+                free_nodes.append(node)
+                free_impulses.append(impulse)
+            else:
+                for fragment_node, fragment_impulse in fragments:
+                    free_nodes.append(fragment_node)
+                    free_impulses.append(fragment_impulse)
+        return free_nodes, free_impulses
+
+    def on_physics_step(self, dt):
+        if not self.enabled:
+            return
+        self.check_contacts()
+        self.retire(dt)
+
+    def check_contacts(self):
+        # Pairs where both bodies sleep carry no new impulse, so a scene at
+        # rest skips the manifold walk entirely.
+        if not self.main_app.spatial_index.any_awake:
+            return
+        registry = self.main_app.body_registry
+        blocks = registry.bodies['block']
+        struck = {}
+        for manifold in self.main_app.physics_world.getManifolds():
+            if manifold.getNumManifoldPoints() == 0:
+                continue
+            node0 = manifold.getNode0()
+            node1 = manifold.getNode1()
+            if node0 not in blocks and node1 not in blocks:
+                continue
+            if not node0.isActive() and not node1.isActive():
+                continue
+            impulse = sum(point.getAppliedImpulse() for point in manifold.getManifoldPoints())
+            for node in (node0, node1):
+                if node in blocks and impulse > self.strength_of(registry.info[node]):
+                    struck[node] = blocks[node]
+        for node_path in struck.values():
+            self.fracture(node_path)
+
+    def retire(self, dt):
+        settled = []
+        for node, fragment in self.fragments.items():
+            if fragment[0].getZ() < FALL_LIMIT:
+                settled.append(node)
+            elif node.isActive():
+                fragment[3] = 0.0
+            else:
+                fragment[3] += dt
+                if fragment[3] >= SETTLE_TIME:
+                    settled.append(node)
+        for node in settled:
+            self.release(node)
+
+    def clear(self):
+        for node in list(self.fragments):
+            self.release(node)
+
+    def forget(self):
+        # Live fragments go down with their world; the pool holds detached
+        # nodes only, so it survives.
+        self.fragments = {}
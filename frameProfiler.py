@@ -0,0 +1,120 @@
+import collections
+import csv
+import json
+import time
+
+from direct.task import Task
+from panda3d.core import PStatClient, PStatCollector
+
+# CONSTANTS
+SECTIONS = ('physics', 'camera', 'tasks', 'render')
+COUNTERS = ('bodies', 'active', 'ccd', 'contacts', 'constraints')
+HISTORY_FRAMES = 3600
+COUNTER_INTERVAL = 10
+
+
+class FrameProfiler:
+    # Times named sections of each frame and samples body / contact counters
+    # every COUNTER_INTERVAL frames. The last history_frames frames are kept
+    # for export, so profiling can stay on without growing memory. Each section
+    # also feeds a PStatCollector, which costs nothing unless PStats connects.
+    def __init__(self, main_app, history_frames=HISTORY_FRAMES):
+        self.main_app = main_app
+        self.origin = time.perf_counter()
+        self.frame_start = self.origin
+        self.frame_count = 0
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+        self.starts = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.frames = collections.deque(maxlen=history_frames)
+        self.events = collections.deque(maxlen=history_frames * len(SECTIONS))
+        self.collectors = {name: PStatCollector(f"App:{name.capitalize()}") for name in SECTIONS}
+
+    def begin(self, name):
+        self.collectors[name].start()
+        self.starts[name] = time.perf_counter()
+
+    def end(self, name):
+        now = time.perf_counter()
+        start = self.starts.pop(name, now)
+        self.collectors[name].stop()
+        self.current[name] += now - start
+        self.events.append((name, start - self.origin, now - start))
+
+    def end_frame(self):
+        now = time.perf_counter()
+        # A running PhysicsThread takes the counts between its own steps.
+        if self.frame_count % COUNTER_INTERVAL == 0 and not self.main_app.physics_thread.running:
+            self.count()
+        row = [self.frame_count, self.frame_start - self.origin, now - self.frame_start]
+        row.extend(self.current[name] for name in SECTIONS)
+        row.extend(self.counters[name] for name in COUNTERS)
+        self.frames.append(row)
+
+        self.frame_count += 1
+        self.frame_start = now
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+
+    def count(self):
+        physics_world = self.main_app.physics_world
+        step_size = self.main_app.stepper.step_size
+        active = 0
+        ccd = 0
+        for body in physics_world.getRigidBodies():
+            if not body.isActive():
+                continue
+            active += 1
+            threshold = body.getCcdMotionThreshold()
+            if threshold > 0 and body.getLinearVelocity().length() * step_size > threshold:
+                ccd += 1
+
+        counters = self.counters
+        counters['bodies'] = physics_world.getNumRigidBodies()
+        counters['active'] = active
+        counters['ccd'] = ccd
+        counters['contacts'] = sum(manifold.getNumManifoldPoints() for manifold in physics_world.getManifolds())
+        counters['constraints'] = physics_world.getNumConstraints()
+
+    def summary(self, frames=COUNTER_INTERVAL):
+        rows = list(self.frames)[-frames:]
+        if not rows:
+            return {}
+        result = {'fps': len(rows) / max(sum(row[2] for row in rows), 1e-9)}
+        for offset, name in enumerate(SECTIONS):
+            result[name] = sum(row[3 + offset] for row in rows) / len(rows)
+        result.update(self.counters)
+        return result
+
+    # Render time is measured by two tasks sorted either side of ShowBase's
+    # igLoop (sort 50), which draws the frame.
+    def watch_render(self, task_mgr):
+        task_mgr.add(self.render_begin, 'profilerRenderBegin', sort=49)
+        task_mgr.add(self.render_end, 'profilerRenderEnd', sort=51)
+
+    def render_begin(self, task):
+        self.begin('render')
+        return Task.cont
+
+    def render_end(self, task):
+        self.end('render')
+        self.end_frame()
+        return Task.cont
+
+    def connect_pstats(self):
+        return PStatClient.connect()
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['frame', 'time', 'frame_time'] + list(SECTIONS) + list(COUNTERS))
+            writer.writerows(self.frames)
+
+    # Chrome trace format: load the file in chrome://tracing or Perfetto.
+    def export_trace(self, path):
+        trace_events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': start * 1e6, 'dur': duration * 1e6}
+                        for name, start, duration in self.events]
+        for row in self.frames:
+            trace_events.append({'name': 'counters', 'ph': 'C', 'pid': 0, 'ts': row[1] * 1e6,
+                                 'args': dict(zip(COUNTERS, row[3 + len(SECTIONS):]))})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
@@ -1,41 +1,39 @@
+import math
+
 from direct.showbase.ShowBaseGlobal import globalClock
-from direct.showbase.ShowBase import ShowBase
-from panda3d.core import Vec3, LPoint3f, DirectionalLight, AmbientLight, WindowProperties, CollisionNode, CollisionTraverser, CollisionRay, CollisionHandlerQueue, GeomNode, CardMaker, TransparencyAttrib
-from panda3d.bullet import BulletWorld, BulletRigidBodyNode, BulletBoxShape, BulletSphereShape, BulletDebugNode, BulletConeShape
+from panda3d.core import Vec3, DirectionalLight, AmbientLight, WindowProperties, TextNode, TransparencyAttrib
 from direct.gui.DirectGui import DirectSlider, DirectFrame, OnscreenText, DirectButton, DirectEntry, DirectLabel
 from direct.gui.OnscreenImage import OnscreenImage
 
-import materialManager
-import destructionManager
+from simulation import Simulation
+import sceneFile
+import frameProfiler
 
 # CONSTANTS
+SCENE_PATH = 'scene.npy'
+RECORDING_PATH = 'recording.bin'
+SCRUB_FRAMES = 30
+PICK_DISTANCE = 1000
+PROFILE_CSV_PATH = 'profile.csv'
+PROFILE_TRACE_PATH = 'profile_trace.json'
+ANALYTICS_PATH = 'analytics.bin'
+STATUS_TIME = 4.0
 MOUSE_SENSITIVITY = 2
 CAMERA_SPEED = 5
 
-class MainApp(ShowBase):
+class MainApp(Simulation):
     def __init__(self):
-        ShowBase.__init__(self)
+        Simulation.__init__(self)
 
-        self.current_block_size = 1.0
         self.alt_pressed = False
-        self.physics_enabled = False
-        self.physics_enabled_string = 'disabled'
         self.camera_position = self.camera.getPos()
-        self.selected_material = 'wood'
-        self.current_shape = 'cube'
-        self.placing_mode = 'building'
-
-        self.material_manager = materialManager.MaterialManager()
-        self.destruction_manager = destructionManager.DestructionManager(self)
 
-        self.setup_window()
         self.setup_camera()
-        self.setup_physics()
         self.setup_lighting()
-        self.add_plane()
         self.setup_controls()
 
         self.taskMgr.add(self.update, "update")
+        self.profiler.watch_render(self.taskMgr)
 
         self.moving_forward = False
         self.moving_backward = False
@@ -50,19 +48,21 @@ class MainApp(ShowBase):
         self.camera_heading = 0
         self.camera_pitch = 0
 
-        self.picker_ray = CollisionRay()
-        self.picker_ray_node = CollisionNode('mouseRay')
-        self.picker_ray_node.addSolid(self.picker_ray)
-        self.picker_ray_node.setFromCollideMask(GeomNode.getDefaultCollideMask())
-        self.picker_ray_np = self.camera.attachNewNode(self.picker_ray_node)
-        self.picker_handler = CollisionHandlerQueue()
-        self.picker_traverser = CollisionTraverser('mousePicker')
-        self.picker_traverser.addCollider(self.picker_ray_np, self.picker_handler)
-
         self.setup_ui()
+        self.render_batcher.set_enabled(True)
+        self.fracture_manager.set_enabled(True)
+        self.debris_manager.set_enabled(True)
+        self.particle_system.set_enabled(True)
         self.accept('alt', self.toggle_mouse)
         self.accept('mouse1', self.add_block_at_click)
 
+    def on_first_frame(self, task):
+        # Going fullscreen resizes the window, so it waits until the first
+        # frame is up instead of delaying it.
+        result = Simulation.on_first_frame(self, task)
+        self.setup_window()
+        return result
+
     def setup_window(self):
         props = WindowProperties()
         props.setFullscreen(True)
@@ -73,27 +73,6 @@ class MainApp(ShowBase):
         self.camera.setPos(0, -15, 5)
         self.camera.lookAt(0, 0, 0)
 
-    def setup_physics(self):
-        self.physics_world = BulletWorld()
-        self.physics_world.setGravity(Vec3(0, 0, -9.81))
-
-        self.debug_node = BulletDebugNode('Debug')
-        self.debug_node.showWireframe(True)
-        self.debug_node.showConstraints(True)
-        self.debug_node.showBoundingBoxes(False)
-        self.debug_np = self.render.attachNewNode(self.debug_node)
-
-        bullet_debug_np = BulletDebugNode('BulletDebug')
-        bullet_debug_np.showNormals(False)
-        bullet_debug_np.showWireframe(True)
-        bullet_debug_np.showConstraints(True)
-        bullet_debug_np.showBoundingBoxes(False)
-
-        self.physics_world.setDebugNode(bullet_debug_np)
-
-        self.debug_np.setPos(0, 0, 0)
-        self.debug_np.setHpr(0, 0, 0)
-
     def setup_lighting(self):
         d_light = DirectionalLight("d_light")
         d_light.setColor((1, 1, 1, 1))
@@ -106,77 +85,6 @@ class MainApp(ShowBase):
         a_light_np = self.render.attachNewNode(a_light)
         self.render.setLight(a_light_np)
 
-    def add_plane(self):
-        plane_shape = BulletBoxShape(Vec3(10, 10, 0.1))
-        plane_node = BulletRigidBodyNode('Ground')
-        plane_node.addShape(plane_shape)
-        plane_node.setMass(0)
-        plane_node.setFriction(1.0)
-        plane_np = self.render.attachNewNode(plane_node)
-        plane_np.setPos(0, 0, 0)
-
-        self.physics_world.attachRigidBody(plane_node)
-
-        cm = CardMaker("ground")
-        cm.setFrame(-10, 10, -10, 10)
-        plane_visual = self.render.attachNewNode(cm.generate())
-        plane_visual.setPos(0, 0, -0.1)
-        plane_visual.lookAt(0, 0, -1)
-        plane_visual.setColor(0, 1, 0.3, 1)
-
-    def add_cube(self, position):
-        size = self.current_block_size
-
-        if self.current_shape == 'cube':
-            shape = BulletBoxShape(Vec3(size / 2, size / 2, size / 2))
-        elif self.current_shape == 'cone':
-            shape = BulletConeShape(size / 2, size)
-        elif self.current_shape == 'sphere':
-            shape = BulletSphereShape(size / 2)
-        else:
-            return
-
-        block_node = BulletRigidBodyNode('Box')
-
-        material_properties = self.material_manager.get_material_properties(self.selected_material, self.current_block_size)
-        mass = material_properties['mass']
-        friction = material_properties['friction']
-        restitution = material_properties['restitution']
-        color = material_properties['color']
-
-        block_node.setMass(mass)
-        block_node.addShape(shape)
-        block_node.setFriction(friction)
-        block_node.setRestitution(restitution)
-        block_node.setLinearSleepThreshold(0.0)
-        block_node.setAngularSleepThreshold(0.0)
-
-        block_node.setCcdMotionThreshold(1e-7)
-        block_node.setCcdSweptSphereRadius(0.5)
-
-        block_node.setLinearDamping(0.1)
-        block_node.setAngularDamping(0.1)
-
-        block_np = self.render.attachNewNode(block_node)
-        block_np.setPos(position)
-        block_np.setName('Box')
-
-        self.physics_world.attachRigidBody(block_node)
-
-        if self.current_shape == 'cube':
-            model = self.loader.loadModel('models/box')
-        elif self.current_shape == 'cone':
-            model = self.loader.loadModel('assets/Cone.egg')
-        elif self.current_shape == 'sphere':
-            model = self.loader.loadModel('models/misc/sphere')
-
-        if self.current_shape == 'cone':
-            model.setScale(size / 2, size / 2, size)
-        else:
-            model.setScale(size)
-        model.setColor(color)
-        model.reparentTo(block_np)
-
     def setup_controls(self):
         self.accept("w", self.set_moving, ["forward", True])
         self.accept("w-up", self.set_moving, ["forward", False])
@@ -187,6 +95,23 @@ class MainApp(ShowBase):
         self.accept("d", self.set_moving, ["right", True])
         self.accept("d-up", self.set_moving, ["right", False])
         self.accept("escape", self.exit_app)
+        self.accept("[", self.scale_time, [0.5])
+        self.accept("]", self.scale_time, [2.0])
+        self.accept("b", self.toggle_batching)
+        self.accept("i", self.toggle_islands)
+        self.accept("x", self.toggle_fracture)
+        self.accept("o", self.toggle_region_of_interest)
+        self.accept("t", self.toggle_physics_thread)
+        self.accept("f5", self.save_scene)
+        self.accept("f9", self.load_scene)
+        self.accept("r", self.toggle_recording)
+        self.accept("p", self.toggle_playback)
+        self.accept(",", self.transform_player.scrub, [-SCRUB_FRAMES])
+        self.accept(".", self.transform_player.scrub, [SCRUB_FRAMES])
+        self.accept("f3", self.toggle_profiler)
+        self.accept("f4", self.toggle_analytics)
+        self.accept("f6", self.export_profile)
+        self.accept("f7", self.profiler.connect_pstats)
 
         self.move_speed = CAMERA_SPEED
         self.mouse_sensitivity = MOUSE_SENSITIVITY
@@ -316,6 +241,26 @@ class MainApp(ShowBase):
                                             pos=(0.1, 0, -0.2),
                                             parent=self.ui_frame_right)
 
+        self.explosion_inputs = None
+
+        self.crosshair = OnscreenImage(image='assets/crosshair.png', pos=(0, 0, 0), scale=0.005)
+        self.crosshair.setTransparency(TransparencyAttrib.MAlpha)
+
+        self.mode_label = OnscreenText(text=f"MODE: {self.placing_mode.upper()}", pos=(-1.1, -0.8), scale=0.05)
+        self.shape_label = OnscreenText(text=f"BLOCK: {self.current_shape.upper()}", pos=(-0.6, -0.8), scale=0.05)
+        self.material_label = OnscreenText(text=f"MATERIAL: {self.selected_material.upper()}", pos=(-0.05, -0.8), scale=0.05)
+        self.physics_label = OnscreenText(text=f"PHYSICS ENABLED: {self.physics_enabled_string.upper()}", pos=(0.6, -0.8), scale=0.05)
+        self.time_label = OnscreenText(text=f"TIME SCALE: x{self.stepper.time_scale:.3g}", pos=(-1.1, -0.7), scale=0.05)
+        self.profiler_label = OnscreenText(text="", pos=(-1.25, 0.7), scale=0.045, align=TextNode.ALeft, mayChange=True)
+        self.profiler_label.hide()
+        self.analytics_label = OnscreenText(text="", pos=(-1.25, 0.55), scale=0.045, align=TextNode.ALeft, mayChange=True)
+        self.analytics_label.hide()
+        self.status_label = OnscreenText(text="", pos=(0, 0.85), scale=0.05, fg=(1, 0.3, 0.3, 1), mayChange=True)
+    
+
+    # The explosion inputs are rarely used, so they are only built the first
+    # time they are shown.
+    def create_explosion_inputs(self):
         self.explosion_force_label = DirectLabel(text="Force:",
                                              scale=0.05,
                                              pos=(0, 0, -0.4),
@@ -342,37 +287,26 @@ class MainApp(ShowBase):
                                                 focus=0,
                                                 width=3)
 
-        self.explosion_force_label.hide()
-        self.explosion_force_entry.hide()
-        self.explosion_radius_label.hide()
-        self.explosion_radius_entry.hide()
-
-        self.crosshair = OnscreenImage(image='assets/crosshair.png', pos=(0, 0, 0), scale=0.005)
-        self.crosshair.setTransparency(TransparencyAttrib.MAlpha)
-
-        self.mode_label = OnscreenText(text=f"MODE: {self.placing_mode.upper()}", pos=(-1.1, -0.8), scale=0.05)
-        self.shape_label = OnscreenText(text=f"BLOCK: {self.current_shape.upper()}", pos=(-0.6, -0.8), scale=0.05)
-        self.material_label = OnscreenText(text=f"MATERIAL: {self.selected_material.upper()}", pos=(-0.05, -0.8), scale=0.05)
-        self.physics_label = OnscreenText(text=f"PHYSICS ENABLED: {self.physics_enabled_string.upper()}", pos=(0.6, -0.8), scale=0.05)
-    
-
-    def clear_blocks(self):
-        for node in self.render.getChildren():
-            if node.getName() == 'Box' or node.getName() == 'WreckingBall' or node.getName() == 'HeavyBall':
-                node.removeNode()
+        self.explosion_inputs = [self.explosion_force_label, self.explosion_force_entry,
+                                 self.explosion_radius_label, self.explosion_radius_entry]
+
+    def set_explosion_inputs_visible(self, visible):
+        if self.explosion_inputs is None:
+            if not visible:
+                return
+            self.create_explosion_inputs()
+        for widget in self.explosion_inputs:
+            if visible:
+                widget.show()
+            else:
+                widget.hide()
 
     def show_explosion_inputs(self):
         if self.placing_mode == 'explosion':
-            self.explosion_force_label.hide()
-            self.explosion_force_entry.hide()
-            self.explosion_radius_label.hide()
-            self.explosion_radius_entry.hide()
+            self.set_explosion_inputs_visible(False)
             self.placing_mode = 'building'
         else:
-            self.explosion_force_label.show()
-            self.explosion_force_entry.show()
-            self.explosion_radius_label.show()
-            self.explosion_radius_entry.show()
+            self.set_explosion_inputs_visible(True)
             self.placing_mode = 'explosion'
         self.update_labels()
     
@@ -389,6 +323,101 @@ class MainApp(ShowBase):
             self.destruction_manager.trigger_earthquake()
             self.update_labels()
 
+    def toggle_batching(self):
+        if self.physics_thread.defer(self.toggle_batching):
+            return
+        self.render_batcher.set_enabled(not self.render_batcher.enabled)
+
+    def save_scene(self):
+        if self.physics_thread.defer(self.save_scene):
+            return
+        sceneFile.save_scene(self, SCENE_PATH)
+
+    def load_scene(self):
+        if self.physics_thread.defer(self.load_scene):
+            return
+        # Opened before clearing so a missing or broken file keeps the scene.
+        try:
+            records = sceneFile.open_scene(SCENE_PATH)
+        except (OSError, ValueError) as error:
+            self.show_status(f"Could not load {SCENE_PATH}: {error}")
+            return
+        self.clear_blocks()
+        sceneFile.add_records(self, records)
+        self.render_batcher.refresh()
+
+    def show_status(self, text):
+        self.status_label.setText(text)
+        self.taskMgr.remove('clear_status')
+        self.taskMgr.doMethodLater(STATUS_TIME, self.clear_status, 'clear_status')
+
+    def clear_status(self, task):
+        self.status_label.setText("")
+        return task.done
+
+    def toggle_recording(self):
+        if self.physics_thread.defer(self.toggle_recording):
+            return
+        if self.transform_recorder.recording:
+            self.transform_recorder.stop()
+        else:
+            self.transform_recorder.start(RECORDING_PATH)
+
+    def toggle_playback(self):
+        if self.physics_thread.defer(self.toggle_playback):
+            return
+        if self.transform_player.playing:
+            self.transform_player.stop()
+        else:
+            self.transform_recorder.stop()
+            try:
+                self.transform_player.start(RECORDING_PATH)
+            except (OSError, ValueError) as error:
+                self.show_status(f"Could not play {RECORDING_PATH}: {error}")
+
+    def toggle_profiler(self):
+        if self.profiler_label.isHidden():
+            self.profiler_label.show()
+            self.update_profiler_label()
+        else:
+            self.profiler_label.hide()
+
+    def toggle_analytics(self):
+        if self.analytics_label.isHidden():
+            self.analytics_label.show()
+            self.physics_thread.submit(self.collapse_analytics.start, ANALYTICS_PATH)
+        else:
+            self.analytics_label.hide()
+            self.physics_thread.submit(self.collapse_analytics.stop)
+
+    def export_profile(self):
+        self.profiler.export_csv(PROFILE_CSV_PATH)
+        self.profiler.export_trace(PROFILE_TRACE_PATH)
+
+    def toggle_islands(self):
+        if self.physics_thread.defer(self.toggle_islands):
+            return
+        self.island_manager.set_enabled(not self.island_manager.enabled)
+
+    def toggle_fracture(self):
+        if self.physics_thread.defer(self.toggle_fracture):
+            return
+        self.fracture_manager.set_enabled(not self.fracture_manager.enabled)
+        if not self.fracture_manager.enabled:
+            self.fracture_manager.clear()
+
+    def toggle_region_of_interest(self):
+        if self.physics_thread.defer(self.toggle_region_of_interest):
+            return
+        self.region_of_interest.set_enabled(not self.region_of_interest.enabled)
+
+    def toggle_physics_thread(self):
+        self.physics_thread.set_enabled(not self.physics_thread.running)
+
+    def scale_time(self, factor):
+        self.stepper.set_time_scale(self.stepper.time_scale * factor)
+        self.update_labels()
+
     def set_block_size(self):
         self.current_block_size = self.block_size_slider['value']
 
@@ -432,21 +461,16 @@ class MainApp(ShowBase):
         self.accept("d-up", self.set_moving, ["right", False])
 
     def exit_app(self):
+        self.physics_thread.stop()
         self.userExit()
 
     def add_block_at_click(self):
         if self.mouse_watcher.hasMouse() and (self.placing_mode == 'building' or self.placing_mode == 'dropping' or self.placing_mode == 'explosion'):
-            self.picker_ray.setFromLens(self.camNode, 0, 0)
-            self.picker_traverser.traverse(self.render)
-            if self.picker_handler.getNumEntries() > 0:
-                self.picker_handler.sortEntries()
-                entry = self.picker_handler.getEntry(0)
-                point = entry.getSurfacePoint(self.render)
-
-                snapped_x = round(point.getX() / self.current_block_size) * self.current_block_size
-                snapped_y = round(point.getY() / self.current_block_size) * self.current_block_size
-                snapped_z = round(point.getZ() / self.current_block_size) * self.current_block_size + self.current_block_size / 2
-
+            size = self.current_block_size
+            from_pos = self.camera.getPos(self.render)
+            to_pos = from_pos + self.render.getRelativeVector(self.camera, Vec3(0, PICK_DISTANCE, 0))
+            position = self.pick_cell(from_pos, to_pos, size)
+            if position is not None:
                 if self.placing_mode == 'explosion':
                     try:
                         force = float(self.explosion_force_entry.get().strip())
@@ -456,21 +480,24 @@ class MainApp(ShowBase):
                         radius = float(self.explosion_radius_entry.get().strip())
                     except ValueError:
                         radius = 5.0
-                    self.destruction_manager.trigger_explosion(Vec3(snapped_x, snapped_y, snapped_z), force, radius)
-                    self.explosion_force_label.hide()
-                    self.explosion_force_entry.hide()
-                    self.explosion_radius_label.hide()
-                    self.explosion_radius_entry.hide()
+                    self.destruction_manager.trigger_explosion(position, force, radius)
+                    self.set_explosion_inputs_visible(False)
                     self.placing_mode = 'building'
                     self.update_labels()
                 elif self.placing_mode == 'dropping':
-                    self.destruction_manager.drop_heavy_ball(Vec3(snapped_x, snapped_y, snapped_z))
+                    self.destruction_manager.drop_heavy_ball(position)
                     self.placing_mode = 'building'
                     self.update_labels()
                 elif self.placing_mode == 'earthquake':
                     return
                 else:
-                    self.add_cube(Vec3(snapped_x, snapped_y, snapped_z))
+                    self.build_block(position, size)
+
+    def build_block(self, position, size):
+        if self.physics_thread.defer(self.build_block, position, size):
+            return
+        if self.occupancy_grid.is_free(position, size):
+            self.add_cube(position)
 
     def enable_physics(self):
         self.physics_enabled = not self.physics_enabled
@@ -485,6 +512,7 @@ class MainApp(ShowBase):
         self.shape_label.setText(f"BLOCK: {self.current_shape.upper()}")
         self.material_label.setText(f"MATERIAL: {self.selected_material.upper()}")
         self.physics_label.setText(f"PHYSICS ENABLED: {self.physics_enabled_string.upper()}")
+        self.update_time_label()
 
         if self.placing_mode == 'earthquake':
             self.cube_button['state'] = 'disabled'
@@ -495,12 +523,62 @@ class MainApp(ShowBase):
             self.cone_button['state'] = 'normal'
             self.sphere_button['state'] = 'normal'
 
+    def update_time_label(self):
+        text = f"TIME SCALE: x{self.stepper.time_scale:.3g}"
+        if self.stepper.dropped_time > 0:
+            text += f"  DROPPED: {self.stepper.dropped_time:.2f}s"
+        self.time_label.setText(text)
+
+    def update_profiler_label(self):
+        summary = self.profiler.summary()
+        if not summary:
+            return
+        sections = "  ".join(f"{name.upper()}: {summary[name] * 1000:.1f}ms" for name in frameProfiler.SECTIONS)
+        counters = "  ".join(f"{name.upper()}: {summary[name]}" for name in frameProfiler.COUNTERS)
+        startup = f"\nFIRST FRAME: {self.first_frame_time:.3f}s" if self.first_frame_time is not None else ""
+        self.profiler_label.setText(f"FPS: {summary['fps']:.0f}  {sections}\n{counters}{startup}")
+
+    def update_analytics_label(self):
+        latest = self.collapse_analytics.latest
+        if not latest:
+            return
+        energy = "  ".join(f"{material.upper()}: {latest['kinetic_energy_' + material]:.1f}J"
+                           for material in self.collapse_analytics.materials)
+        settle = "-" if math.isnan(latest['settle_time']) else f"{latest['settle_time']:.1f}s"
+        self.analytics_label.setText(f"KE: {latest['kinetic_energy']:.1f}J  {energy}\n"
+                                     f"DISPLACED: {latest['displaced_fraction'] * 100:.0f}%  HEIGHT: {latest['height']:.1f}  "
+                                     f"SPREAD: {latest['spread']:.1f}  SETTLED: {settle}")
+
     def update(self, task):
         dt = globalClock.getDt()
+        profiler = self.profiler
 
+        profiler.begin('physics')
         if self.physics_enabled:
-            self.physics_world.doPhysics(dt)
-    
+            self.step_physics(dt)
+            if self.stepper.last_dropped_time > 0:
+                self.update_time_label()
+        profiler.end('physics')
+
+        profiler.begin('tasks')
+        # While the PhysicsThread steps, skip the world work rather than wait.
+        physics_thread = self.physics_thread
+        if physics_thread.lock.acquire(blocking=False):
+            try:
+                self.transform_player.update(dt)
+                self.render_batcher.update(dt)
+            finally:
+                physics_thread.lock.release()
+        if physics_thread.apply():
+            self.update_labels()
+        self.particle_system.update(dt * self.stepper.time_scale)
+        if not self.profiler_label.isHidden() and profiler.frame_count % frameProfiler.COUNTER_INTERVAL == 0:
+            self.update_profiler_label()
+        if not self.analytics_label.isHidden() and profiler.frame_count % frameProfiler.COUNTER_INTERVAL == 0:
+            self.update_analytics_label()
+        profiler.end('tasks')
+
+        profiler.begin('camera')
         if self.moving_forward:
             self.camera.setY(self.camera, self.move_speed * dt)
         if self.moving_backward:
@@ -519,8 +597,10 @@ class MainApp(ShowBase):
                 self.camera.setHpr(self.camera_heading, self.camera_pitch, 0)
 
             self.win.movePointer(0, int(self.win.getProperties().getXSize() / 2), int(self.win.getProperties().getYSize() / 2))
+        profiler.end('camera')
 
         return task.cont
 
-app = MainApp()
-app.run()
+if __name__ == '__main__':
+    app = MainApp()
+    app.run()
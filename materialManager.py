@@ -1,16 +1,61 @@
+import json
+import math
+import os
+
+import numpy as np
+from panda3d.core import ColorAttrib, RenderState
+
+# CONSTANTS
+MATERIALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'materials.json')
+SIZE_DECIMALS = 3
+# Volume of each shape at size 1: the cube's edge, the sphere's diameter and
+# the cone's base diameter and height.
+UNIT_VOLUMES = {'cube': 1.0, 'cone': math.pi / 12, 'sphere': math.pi / 6}
+TABLE_PROPERTIES = ('density', 'friction', 'restitution', 'strength', 'blast_transmission', 'blast_coupling')
+
+
 class MaterialManager:
-    def __init__(self):
-        self.materials = {
-            'wood': {'mass': 1.0, 'friction': 0.5, 'restitution': 0.2, 'color': (0.65, 0.5, 0.39, 1)},
-            'metal': {'mass': 5.0, 'friction': 0.3, 'restitution': 0.1, 'color': (0.7, 0.7, 0.7, 1)},
-            'stone': {'mass': 3.0, 'friction': 0.7, 'restitution': 0.05, 'color': (0.5, 0.5, 0.5, 1)},
-        }
+    # Materials come from a JSON file in file order, which fixes their ids.
+    # Block properties are worked out once per (material, shape, size) and
+    # the same dict is handed to every caller, so it must not be modified.
+    # Mass is density times the shape's volume. Each material also has one
+    # RenderState shared by every block of that material, and table holds one
+    # array per numeric property indexed by material id for bulk lookups.
+    def __init__(self, path=MATERIALS_PATH):
+        with open(path) as materials_file:
+            self.materials = json.load(materials_file)
+        for properties in self.materials.values():
+            properties['color'] = tuple(properties['color'])
+        self.ids = {material: index for index, material in enumerate(self.materials)}
+        self.table = {name: np.array([properties[name] for properties in self.materials.values()])
+                      for name in TABLE_PROPERTIES}
+        self.properties = {}
+        self.states = {}
+
+    def material_id(self, material):
+        return self.ids[material]
 
-    def get_material_properties(self, material, size):
-        properties = self.materials.get(material)
-        return {
-            'mass': properties['mass'] * size,
+    def get_material_properties(self, material, size, shape_type='cube'):
+        key = (material, shape_type, round(size, SIZE_DECIMALS))
+        block_properties = self.properties.get(key)
+        if block_properties is not None:
+            return block_properties
+        properties = self.materials[material]
+        block_properties = {
+            'mass': properties['density'] * UNIT_VOLUMES[shape_type] * size ** 3,
             'friction': properties['friction'],
             'restitution': properties['restitution'],
-            'color': properties['color']
+            'color': properties['color'],
+            'linear_sleep': properties['linear_sleep'],
+            'angular_sleep': properties['angular_sleep'],
+            'strength': properties['strength'] * size * size
         }
+        self.properties[key] = block_properties
+        return block_properties
+
+    def render_state(self, material):
+        state = self.states.get(material)
+        if state is None:
+            state = RenderState.make(ColorAttrib.makeFlat(self.materials[material]['color']))
+            self.states[material] = state
+        return state
\ No newline at end of file
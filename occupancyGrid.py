@@ -0,0 +1,98 @@
+import itertools
+import math
+
+# CONSTANTS
+CELL_SIZE = 0.5
+EPSILON = 1e-3
+# Top face of the ground box; block courses are stacked up from here.
+GROUND_TOP = 0.1
+# Settled blocks sit a little off the grid they were placed on, so each block
+# only claims its cube shrunk by this fraction of its size on every side.
+OVERLAP_TOLERANCE = 0.1
+
+
+class OccupancyGrid:
+    # Sparse map from grid cells to the block covering them. Each block marks
+    # every CELL_SIZE cell its bounding cube overlaps, so placement checks cost
+    # O(size ** 3) whatever the scene size. Bodies reported awake after a
+    # physics step are re-placed on the next query, so only blocks that moved
+    # are touched; bulk changes mark the grid dirty for a full rebuild.
+    # Blocks removed without a rebuild (fractured ones) are dropped when a
+    # query runs into them. OVERLAP_TOLERANCE keeps a block that settled
+    # slightly into the next cell from blocking it.
+    def __init__(self, body_registry, cell_size=CELL_SIZE):
+        self.body_registry = body_registry
+        self.cell_size = cell_size
+        self.cells = {}
+        self.node_cells = {}
+        self.moved = set()
+        self.dirty = True
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def mark_moved(self, nodes):
+        if not self.dirty:
+            self.moved.update(nodes)
+
+    def cells_for(self, position, size):
+        half = size * (0.5 - OVERLAP_TOLERANCE) - EPSILON
+        ranges = [range(math.floor((position[axis] - half) / self.cell_size),
+                        math.floor((position[axis] + half) / self.cell_size) + 1) for axis in range(3)]
+        return itertools.product(*ranges)
+
+    def add(self, node, position, size):
+        if self.dirty:
+            return
+        self.place(node, position, size)
+
+    def place(self, node, position, size):
+        self.drop(node)
+        cells = list(self.cells_for(position, size))
+        for cell in cells:
+            self.cells[cell] = node
+        self.node_cells[node] = cells
+
+    def drop(self, node):
+        cells = self.cells
+        for cell in self.node_cells.pop(node, ()):
+            if cells.get(cell) == node:
+                del cells[cell]
+
+    def rebuild(self):
+        self.cells = {}
+        self.node_cells = {}
+        self.moved = set()
+        info = self.body_registry.info
+        for node, node_path in self.body_registry.bodies['block'].items():
+            self.place(node, node_path.getNetTransform().getPos(), info[node]['size'])
+        self.dirty = False
+
+    def update(self):
+        # Re-placing costs more per block than a rebuild, so fall back to one
+        # when most of the blocks moved.
+        if self.dirty or len(self.moved) * 2 > len(self.node_cells):
+            self.rebuild()
+            return
+        blocks = self.body_registry.bodies['block']
+        info = self.body_registry.info
+        for node in self.moved:
+            node_path = blocks.get(node)
+            if node_path is None:
+                self.drop(node)
+            else:
+                self.place(node, node_path.getNetTransform().getPos(), info[node]['size'])
+        self.moved = set()
+
+    def is_free(self, position, size):
+        self.update()
+        cells = self.cells
+        blocks = self.body_registry.bodies['block']
+        for cell in self.cells_for(position, size):
+            node = cells.get(cell)
+            if node is None:
+                continue
+            if node in blocks:
+                return False
+            self.drop(node)
+        return True
@@ -0,0 +1,193 @@
+import threading
+
+import numpy as np
+from direct.showbase.DirectObject import DirectObject
+from panda3d.core import (Geom, GeomNode, GeomPoints, GeomVertexArrayFormat, GeomVertexData, GeomVertexFormat,
+                          InternalName, OmniBoundingVolume, TransparencyAttrib)
+
+# CONSTANTS
+MAX_PARTICLES = 50000
+POINT_SIZE = 3
+GRAVITY = -9.81
+GROUND_HEIGHT = 0.1
+BOUNCE = 0.3
+GROUND_FRICTION = 0.5
+FLASH_PARTICLES = 3000
+FLASH_SPEED = 4.0
+FLASH_LIFETIME = (0.2, 0.6)
+FLASH_START_COLOR = (1.0, 0.95, 0.6, 1.0)
+FLASH_END_COLOR = (0.8, 0.2, 0.05, 0.0)
+DUST_PARTICLES = 6000
+DUST_SPEED = 1.5
+DUST_LIFETIME = (2.0, 5.0)
+DUST_GRAVITY = 0.05
+DUST_DRAG = 1.5
+DUST_START_COLOR = (0.55, 0.5, 0.45, 0.8)
+DUST_END_COLOR = (0.55, 0.5, 0.45, 0.0)
+IMPACT_PARTICLES = 800
+IMPACT_SPEED = 3.0
+IMPACT_INTERVAL = 0.25
+BALL_CATEGORIES = ('heavy_ball', 'wrecking_ball')
+# One packed row per particle: float32 position, then uint8 RGBA.
+VERTEX_DTYPE = np.dtype([('vertex', '<f4', 3), ('color', 'u1', 4)])
+
+
+def make_point_format():
+    array_format = GeomVertexArrayFormat()
+    array_format.addColumn(InternalName.getVertex(), 3, Geom.NTFloat32, Geom.CPoint)
+    array_format.addColumn(InternalName.getColor(), 4, Geom.NTUint8, Geom.CColor)
+    return GeomVertexFormat.registerFormat(GeomVertexFormat(array_format))
+
+
+class ParticleSystem(DirectObject):
+    # Explosion flashes and dust without a node per particle. All particle
+    # state lives in NumPy arrays with the live particles packed at the front;
+    # each frame they are integrated in bulk, dead ones are compacted away and
+    # the live rows are written straight into one GeomVertexData through its
+    # memoryview, drawn as a single GeomPoints. Flash and dust only differ in
+    # their per-particle gravity, drag, lifetime and colours.
+    def __init__(self, main_app, max_particles=MAX_PARTICLES):
+        self.main_app = main_app
+        self.enabled = False
+        self.max_particles = max_particles
+        self.count = 0
+        self.drawn = 0
+        self.last_impact = {}
+        # Emitters can run on the PhysicsThread while update runs on the main thread.
+        self.lock = threading.Lock()
+
+        self.positions = np.zeros((max_particles, 3), dtype=np.float32)
+        self.velocities = np.zeros((max_particles, 3), dtype=np.float32)
+        self.ages = np.zeros(max_particles, dtype=np.float32)
+        self.lifetimes = np.ones(max_particles, dtype=np.float32)
+        self.gravity = np.zeros(max_particles, dtype=np.float32)
+        self.drag = np.zeros(max_particles, dtype=np.float32)
+        self.start_colors = np.zeros((max_particles, 4), dtype=np.float32)
+        self.end_colors = np.zeros((max_particles, 4), dtype=np.float32)
+        self.arrays = (self.positions, self.velocities, self.ages, self.lifetimes, self.gravity, self.drag,
+                       self.start_colors, self.end_colors)
+
+        self.vertex_data = GeomVertexData('particles', make_point_format(), Geom.UHDynamic)
+        self.vertex_data.uncleanSetNumRows(max_particles)
+        self.points = GeomPoints(Geom.UHDynamic)
+        self.points.setNonindexedVertices(0, 0)
+        geom = Geom(self.vertex_data)
+        geom.addPrimitive(self.points)
+        geom_node = GeomNode('particles')
+        geom_node.addGeom(geom)
+        # The vertices move every frame, so skip bounds recomputation and culling.
+        geom_node.setBounds(OmniBoundingVolume())
+        geom_node.setFinal(True)
+
+        self.node_path = main_app.render.attachNewNode(geom_node)
+        self.node_path.setRenderModeThickness(POINT_SIZE)
+        self.node_path.setTransparency(TransparencyAttrib.MAlpha)
+        self.node_path.setDepthWrite(False)
+        self.node_path.setLightOff()
+        self.node_path.setBin('fixed', 0)
+
+        self.accept('bullet-contact-added', self.on_contact)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.clear()
+
+    def emit(self, position, count, speed, lifetime, gravity, drag, start_color, end_color, spread=0.0):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.add(position, count, speed, lifetime, gravity, drag, start_color, end_color, spread)
+
+    def add(self, position, count, speed, lifetime, gravity, drag, start_color, end_color, spread):
+        start = self.count
+        count = min(count, self.max_particles - start)
+        if count <= 0:
+            return
+        end = start + count
+
+        directions = np.random.normal(size=(count, 3))
+        directions /= np.maximum(np.linalg.norm(directions, axis=1), 1e-6)[:, None]
+        origin = np.asarray(position, dtype=np.float32)
+        self.positions[start:end] = origin + directions * (spread * np.random.random((count, 1)))
+        self.velocities[start:end] = directions * (speed * np.random.random((count, 1)))
+        self.ages[start:end] = 0.0
+        self.lifetimes[start:end] = np.random.uniform(lifetime[0], lifetime[1], count)
+        self.gravity[start:end] = gravity
+        self.drag[start:end] = drag
+        self.start_colors[start:end] = start_color
+        self.end_colors[start:end] = end_color
+        self.count = end
+
+    def emit_explosion(self, position, radius):
+        self.emit(position, FLASH_PARTICLES, FLASH_SPEED * radius, FLASH_LIFETIME, 1.0, 0.0,
+                  FLASH_START_COLOR, FLASH_END_COLOR)
+        self.emit(position, DUST_PARTICLES, DUST_SPEED * radius, DUST_LIFETIME, DUST_GRAVITY, DUST_DRAG,
+                  DUST_START_COLOR, DUST_END_COLOR, radius / 2)
+
+    def emit_dust(self, position, radius, count=IMPACT_PARTICLES):
+        self.emit(position, count, DUST_SPEED * 2, DUST_LIFETIME, DUST_GRAVITY, DUST_DRAG,
+                  DUST_START_COLOR, DUST_END_COLOR, radius)
+
+    def on_contact(self, node0, node1):
+        if not self.enabled or self.main_app.physics_thread.defer(self.on_contact, node0, node1):
+            return
+        categories = self.main_app.body_registry.categories
+        for ball in (node0, node1):
+            if categories.get(ball) not in BALL_CATEGORIES:
+                continue
+            if ball.getLinearVelocity().length() < IMPACT_SPEED:
+                continue
+            now = self.main_app.stepper.sim_time
+            if now - self.last_impact.get(ball, -IMPACT_INTERVAL) < IMPACT_INTERVAL:
+                continue
+            self.last_impact[ball] = now
+            radius = ball.getShape(0).getRadius()
+            position = self.main_app.body_registry.bodies[categories[ball]][ball].getPos(self.main_app.render)
+            self.emit_dust(position - (0, 0, radius / 2), radius)
+
+    def update(self, dt):
+        with self.lock:
+            self.integrate(dt)
+
+    def integrate(self, dt):
+        count = self.count
+        if count == 0 and self.drawn == 0:
+            return
+
+        self.ages[:count] += dt
+        alive = self.ages[:count] < self.lifetimes[:count]
+        if not alive.all():
+            live = int(np.count_nonzero(alive))
+            for array in self.arrays:
+                array[:live] = array[:count][alive]
+            count = self.count = live
+
+        positions = self.positions[:count]
+        velocities = self.velocities[:count]
+        velocities[:, 2] += GRAVITY * self.gravity[:count] * dt
+        velocities *= np.maximum(1.0 - self.drag[:count] * dt, 0.0)[:, None]
+        positions += velocities * dt
+        grounded = positions[:, 2] < GROUND_HEIGHT
+        if grounded.any():
+            positions[grounded, 2] = GROUND_HEIGHT
+            velocities[grounded, 2] *= -BOUNCE
+            velocities[grounded, :2] *= GROUND_FRICTION
+
+        if count:
+            fade = (self.ages[:count] / self.lifetimes[:count])[:, None]
+            start_colors = self.start_colors[:count]
+            colors = start_colors + (self.end_colors[:count] - start_colors) * fade
+            # A fresh view every frame: holding one would keep the array shared
+            # and force a copy on the next modifyArray.
+            rows = np.frombuffer(memoryview(self.vertex_data.modifyArray(0)), dtype=VERTEX_DTYPE)
+            rows['vertex'][:count] = positions
+            rows['color'][:count] = colors * 255
+            del rows
+        self.points.setNonindexedVertices(0, count)
+        self.drawn = count
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+        self.last_impact = {}
@@ -0,0 +1,54 @@
+MIN_TIME_SCALE = 0.125
+MAX_TIME_SCALE = 4.0
+
+
+class FixedStepper:
+    # Steps a BulletWorld in fixed increments out of an accumulator. Frame time
+    # is multiplied by time_scale first; anything beyond max_substeps worth of
+    # steps is discarded and added to dropped_time instead of being simulated
+    # late, so a slow frame can never snowball into slower frames.
+    def __init__(self, physics_world, step_size=1.0 / 60.0, max_substeps=5, time_scale=1.0):
+        self.physics_world = physics_world
+        self.step_size = step_size
+        self.max_substeps = max_substeps
+        self.time_scale = time_scale
+
+        self.accumulator = 0.0
+        self.step_count = 0
+        self.sim_time = 0.0
+        self.dropped_time = 0.0
+        self.last_dropped_time = 0.0
+        self.step_callbacks = []
+
+    def add_step_callback(self, callback):
+        self.step_callbacks.append(callback)
+
+    def set_time_scale(self, time_scale):
+        self.time_scale = max(MIN_TIME_SCALE, min(MAX_TIME_SCALE, time_scale))
+
+    def step(self):
+        self.physics_world.doPhysics(self.step_size, 1, self.step_size)
+        self.step_count += 1
+        self.sim_time += self.step_size
+        for callback in self.step_callbacks:
+            callback(self.step_size)
+
+    def advance(self, dt):
+        self.accumulator += dt * self.time_scale
+        steps = int(self.accumulator / self.step_size)
+
+        self.last_dropped_time = 0.0
+        if steps > self.max_substeps:
+            self.last_dropped_time = (steps - self.max_substeps) * self.step_size
+            self.dropped_time += self.last_dropped_time
+            steps = self.max_substeps
+
+        self.accumulator -= (steps * self.step_size) + self.last_dropped_time
+        for _ in range(steps):
+            self.step()
+        return steps
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.dropped_time = 0.0
+        self.last_dropped_time = 0.0
@@ -0,0 +1,201 @@
+import threading
+from collections import deque
+
+import numpy as np
+from panda3d.core import Point3, Quat
+
+import frameProfiler
+
+# CONSTANTS
+IDLE_TIMEOUT = 0.1
+# One row per moving body: position, then (w, x, y, z) orientation.
+SNAPSHOT_COLUMNS = 7
+
+
+class PhysicsThread:
+    # Runs the FixedStepper on a worker thread so a heavy step never stalls
+    # rendering, the camera or the GUI. Bullet releases the GIL while it
+    # steps. The main thread only adds frame time to a budget; the worker
+    # spends it, runs queued commands between steps and then publishes the
+    # transforms of every moving body into the back half of a double buffer
+    # before swapping it to the front.
+    #
+    # Bullet writes body transforms into the scene graph itself, and setting
+    # a body's node transform moves the body, so the render thread never
+    # touches the bodies. Each moving body is drawn through a proxy that
+    # instances its visual and follows the latest completed snapshot, while
+    # the body itself is hidden. Proxies are dropped once a body goes to
+    # sleep and it is drawn directly again (or by the RenderBatcher). Merged
+    # islands move as one compound body and are still drawn directly.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.running = False
+        self.thread = None
+        self.error = None
+
+        # Held around every change to the world: by the worker for a batch of
+        # steps and its commands, by the main thread only when free.
+        self.lock = threading.RLock()
+        self.wake = threading.Event()
+        self.commands = deque()
+        self.commands_run = 0
+        self.commands_seen = 0
+        self.budget = 0.0
+        self.budget_lock = threading.Lock()
+
+        self.buffers = [np.zeros((0, SNAPSHOT_COLUMNS), dtype=np.float32) for _ in range(2)]
+        self.snapshot_nodes = [[], []]
+        self.front = 0
+        self.snapshot_id = 0
+        self.applied_id = 0
+        self.swap_lock = threading.Lock()
+        self.publish_count = 0
+
+        self.root = main_app.render.attachNewNode('PhysicsProxies')
+        self.proxies = {}
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self.start()
+        else:
+            self.stop()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='physics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+        with self.lock:
+            self.run_commands()
+        self.clear_proxies()
+
+    def defer(self, function, *args):
+        # Queues a call made off the worker while the thread runs; returns
+        # True when the caller should stop because the call was queued.
+        if not self.running or threading.current_thread() is self.thread:
+            return False
+        self.commands.append((function, args))
+        self.wake.set()
+        return True
+
+    def submit(self, function, *args):
+        if not self.defer(function, *args):
+            function(*args)
+
+    def advance(self, dt):
+        with self.budget_lock:
+            self.budget += dt
+        self.wake.set()
+
+    def run(self):
+        stepper = self.main_app.stepper
+        while self.running:
+            self.wake.wait(IDLE_TIMEOUT)
+            self.wake.clear()
+            with self.budget_lock:
+                dt = self.budget
+                self.budget = 0.0
+
+            try:
+                with self.lock:
+                    self.run_commands()
+                    steps = stepper.advance(dt) if dt > 0 else 0
+                    if steps:
+                        self.publish()
+            except Exception as error:
+                self.error = error
+                self.running = False
+                return
+
+    def run_commands(self):
+        while self.commands:
+            function, args = self.commands.popleft()
+            function(*args)
+            self.commands_run += 1
+
+    def publish(self):
+        main_app = self.main_app
+        moving = [node_path for node_path in main_app.body_registry.dynamic_bodies() if node_path.node().isActive()]
+        rows = [(*node_path.getPos(), *node_path.getQuat()) for node_path in moving]
+
+        back = 1 - self.front
+        buffer = self.buffers[back]
+        if len(buffer) < len(rows):
+            buffer = self.buffers[back] = np.empty((len(rows) * 2, SNAPSHOT_COLUMNS), dtype=np.float32)
+        if rows:
+            buffer[:len(rows)] = rows
+
+        with self.swap_lock:
+            self.snapshot_nodes[back] = moving
+            self.front = back
+            self.snapshot_id += 1
+
+        # The main thread would block on Bullet to read these mid-step.
+        self.publish_count += 1
+        if self.publish_count % frameProfiler.COUNTER_INTERVAL == 0:
+            main_app.profiler.count()
+
+    def apply(self):
+        # Main thread: moves the proxies to the latest completed snapshot.
+        # Returns True when queued commands ran since the last call.
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        ran = self.commands_run != self.commands_seen
+        self.commands_seen = self.commands_run
+
+        with self.swap_lock:
+            if self.snapshot_id == self.applied_id:
+                return ran
+            self.applied_id = self.snapshot_id
+            moving = self.snapshot_nodes[self.front]
+            rows = self.buffers[self.front][:len(moving)].tolist()
+
+        proxies = self.proxies
+        seen = set()
+        for node_path, row in zip(moving, rows):
+            if node_path.isEmpty():
+                continue
+            node = node_path.node()
+            seen.add(node)
+            if node in proxies:
+                proxy = proxies[node][0]
+            else:
+                proxy = self.make_proxy(node, node_path)
+            # Waking blocks are shown again by the RenderBatcher.
+            node_path.hide()
+            proxy.setPosQuat(Point3(*row[:3]), Quat(*row[3:]))
+        for node in [node for node in proxies if node not in seen]:
+            self.drop_proxy(node)
+        return ran
+
+    def make_proxy(self, node, node_path):
+        proxy = self.root.attachNewNode('proxy')
+        visual = node_path.find('visual')
+        if not visual.isEmpty():
+            visual.instanceTo(proxy)
+        self.proxies[node] = (proxy, node_path)
+        return proxy
+
+    def drop_proxy(self, node):
+        proxy, node_path = self.proxies.pop(node)
+        proxy.removeNode()
+        if not node_path.isEmpty() and node not in self.main_app.render_batcher.batched:
+            node_path.show()
+
+    def clear_proxies(self):
+        for node in list(self.proxies):
+            self.drop_proxy(node)
+        with self.swap_lock:
+            self.snapshot_nodes = [[], []]
+            self.applied_id = self.snapshot_id
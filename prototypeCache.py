@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+from panda3d.core import Vec3
+from panda3d.bullet import BulletBoxShape, BulletSphereShape, BulletConeShape
+
+# CONSTANTS
+MODEL_PATHS = {
+    'cube': 'models/box',
+    'cone': 'assets/Cone.egg',
+    'sphere': 'models/misc/sphere',
+}
+MAX_CACHED_SHAPES = 64
+SIZE_DECIMALS = 3
+
+
+class PrototypeCache:
+    # Shares one Bullet shape per (shape, size) and one loaded model per shape
+    # type. Shapes are kept in LRU order so odd sizes picked with the size
+    # slider do not pile up; bodies keep their own reference to an evicted
+    # shape, so eviction never affects existing blocks. Models can be
+    # preloaded on Panda's loader thread; get_model only loads synchronously
+    # when a model is needed before its request has finished.
+    def __init__(self, loader, max_shapes=MAX_CACHED_SHAPES):
+        self.loader = loader
+        self.max_shapes = max_shapes
+        self.shapes = OrderedDict()
+        self.models = {}
+        self.requests = {}
+
+    def get_shape(self, shape_type, size):
+        key = (shape_type, round(size, SIZE_DECIMALS))
+        shape = self.shapes.get(key)
+        if shape is not None:
+            self.shapes.move_to_end(key)
+            return shape
+
+        size = key[1]
+        if shape_type == 'cube':
+            shape = BulletBoxShape(Vec3(size / 2, size / 2, size / 2))
+        elif shape_type == 'cone':
+            shape = BulletConeShape(size / 2, size)
+        elif shape_type == 'sphere':
+            shape = BulletSphereShape(size / 2)
+        else:
+            return None
+
+        self.shapes[key] = shape
+        if len(self.shapes) > self.max_shapes:
+            self.shapes.popitem(last=False)
+        return shape
+
+    def preload(self, shape_types=tuple(MODEL_PATHS)):
+        for shape_type in shape_types:
+            if shape_type in self.models or shape_type in self.requests:
+                continue
+            self.requests[shape_type] = self.loader.loadModel(MODEL_PATHS[shape_type], callback=self.on_loaded,
+                                                              extraArgs=[shape_type])
+
+    def on_loaded(self, model, shape_type):
+        self.requests.pop(shape_type, None)
+        if shape_type not in self.models:
+            self.models[shape_type] = model
+
+    def get_model(self, shape_type):
+        model = self.models.get(shape_type)
+        if model is None:
+            request = self.requests.pop(shape_type, None)
+            if request is not None:
+                request.cancel()
+            model = self.loader.loadModel(MODEL_PATHS[shape_type])
+            self.models[shape_type] = model
+        return model
+
+    def instance_model(self, shape_type, parent, scale, color=None, state=None):
+        # Blocks pass their material's shared RenderState, other bodies a colour.
+        visual = parent.attachNewNode('visual')
+        visual.setScale(scale)
+        if state is not None:
+            visual.setState(state)
+        else:
+            visual.setColor(color)
+        self.get_model(shape_type).instanceTo(visual)
+        return visual
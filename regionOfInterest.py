@@ -0,0 +1,155 @@
+from panda3d.core import Point3
+
+# CONSTANTS
+START_RADIUS = 3.0
+EXPANSION_SPEED = 2.0
+MAX_RADIUS = 12.0
+REGION_LIFETIME = 2.0
+PROPAGATION_SPEED = 1.0
+HOLD_INTERVAL = 1.0
+
+
+class RegionOfInterest:
+    # Holds resting blocks outside every active region as static bodies (mass
+    # 0), so a large site only pays the solver for the part that is moving.
+    # Each destruction event opens a region that grows at EXPANSION_SPEED for
+    # REGION_LIFETIME and releases held blocks as it reaches them. A held
+    # block is also released when a body moving faster than
+    # PROPAGATION_SPEED makes contact with it, a ball doing so opens a new
+    # region, and when a contact between it and a body that is not held goes
+    # away, since that body may have been its support. Blocks that fall
+    # asleep outside every region are held again.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.enabled = False
+        self.regions = []
+        self.held = {}
+        self.elapsed = 0.0
+        main_app.accept('bullet-contact-added', self.on_contact)
+        main_app.accept('bullet-contact-destroyed', self.on_separation)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.regions = []
+        if enabled:
+            self.hold_outside()
+        else:
+            self.release_all()
+
+    def activate(self, position=None, radius=START_RADIUS):
+        # position None (an earthquake) releases every held block.
+        if not self.enabled:
+            return
+        if position is None:
+            self.release_all()
+            return
+        center = Point3(position)
+        self.regions.append([center, radius, 0.0])
+        self.release_within(center, radius)
+
+    def in_region(self, position):
+        return any((position - center).length() <= radius for center, radius, _ in self.regions)
+
+    def hold(self, node):
+        self.held[node] = node.getMass()
+        node.setMass(0)
+        # Static and asleep: Bullet skips pairs of inactive bodies, and static
+        # bodies split simulation islands, so a wake-up stops at held blocks.
+        # New and broken contacts with a held block arrive as
+        # bullet-contact-added and bullet-contact-destroyed events instead of
+        # scanning every manifold each step.
+        node.setActive(False, True)
+        node.notifyCollisions(True)
+
+    def release(self, node):
+        mass = self.held.pop(node, None)
+        if mass is None:
+            return
+        node.setMass(mass)
+        node.notifyCollisions(False)
+        node.setActive(True, True)
+
+    def release_within(self, center, radius):
+        if not self.held:
+            return
+        spatial_index = self.main_app.spatial_index
+        indices, _, _ = spatial_index.query_radius(center, radius)
+        node_paths = spatial_index.node_paths
+        for index in indices:
+            self.release(node_paths[index].node())
+
+    def release_all(self):
+        for node in list(self.held):
+            self.release(node)
+
+    def forget(self):
+        self.regions = []
+        self.held = {}
+
+    def hold_outside(self):
+        main_app = self.main_app
+        if main_app.earthquake.active:
+            return
+        owner = main_app.island_manager.owner
+        render = main_app.render
+        for node, node_path in main_app.body_registry.bodies['block'].items():
+            if node in self.held or node in owner or node.isActive():
+                continue
+            if not self.in_region(node_path.getPos(render)):
+                self.hold(node)
+
+    def on_physics_step(self, dt):
+        if not self.enabled:
+            return
+
+        regions = []
+        for region in self.regions:
+            region[2] += dt
+            if region[2] < REGION_LIFETIME:
+                region[1] = min(region[1] + EXPANSION_SPEED * dt, MAX_RADIUS)
+                self.release_within(region[0], region[1])
+                regions.append(region)
+        self.regions = regions
+
+        self.elapsed += dt
+        if self.elapsed >= HOLD_INTERVAL:
+            self.elapsed = 0.0
+            self.hold_outside()
+
+    def on_contact(self, node0, node1):
+        # Contact events are dispatched on the main thread.
+        if self.main_app.physics_thread.defer(self.on_contact, node0, node1):
+            return
+        held = self.held
+        if node0 in held:
+            held_node, other = node0, node1
+        elif node1 in held:
+            held_node, other = node1, node0
+        else:
+            return
+        if other in held or not other.isActive() or other.getLinearVelocity().length() < PROPAGATION_SPEED:
+            return
+
+        self.release(held_node)
+        registry = self.main_app.body_registry
+        category = registry.categories.get(other)
+        if category in ('wrecking_ball', 'heavy_ball'):
+            position = registry.bodies[category][other].getPos(self.main_app.render)
+            if not self.in_region(position):
+                self.activate(position)
+
+    def on_separation(self, node0, node1):
+        if self.main_app.physics_thread.defer(self.on_separation, node0, node1):
+            return
+        held = self.held
+        if node0 in held:
+            held_node, other = node0, node1
+        elif node1 in held:
+            held_node, other = node1, node0
+        else:
+            return
+        # A released block dropping away (or being removed) stops touching the
+        # held blocks it carried; the ground never moves, so skip it.
+        if other in held or self.main_app.body_registry.categories.get(other) == 'ground':
+            return
+        self.release(held_node)
@@ -0,0 +1,124 @@
+import math
+
+# CONSTANTS
+CHUNK_SIZE = 8.0
+BATCH_INTERVAL = 0.1
+SETTLE_DELAY = 0.5
+
+
+class RenderBatcher:
+    # Merges the visuals of blocks that are asleep, or not yet released, into
+    # one flattened node per (material, chunk). The block itself is hidden
+    # while it is batched and shown again as soon as it wakes.
+    # Chunks keep a rebuild local to the area that changed.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.enabled = False
+        self.root = main_app.render.attachNewNode('StaticBatches')
+
+        self.groups = {}
+        self.members = {}
+        self.batched = {}
+        self.pending = {}
+        self.dirty = set()
+        self.elapsed = 0.0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.refresh()
+        else:
+            self.clear()
+
+    def chunk_key(self, node_path, material):
+        position = node_path.getPos(self.main_app.render)
+        return (material,
+                math.floor(position.getX() / CHUNK_SIZE),
+                math.floor(position.getY() / CHUNK_SIZE),
+                math.floor(position.getZ() / CHUNK_SIZE))
+
+    def update(self, dt):
+        if not self.enabled:
+            return
+        self.elapsed += dt
+        if self.elapsed >= BATCH_INTERVAL:
+            self.refresh(self.elapsed)
+            self.elapsed = 0.0
+
+    def refresh(self, dt=0.0):
+        if not self.enabled:
+            return
+
+        registry = self.main_app.body_registry
+        blocks = registry.bodies['block']
+        physics_running = self.main_app.physics_enabled
+        island_manager = self.main_app.island_manager
+        playing_back = self.main_app.transform_player.playing
+
+        for node in [node for node in self.batched if node not in blocks]:
+            self.release(node, show=False)
+        for node in [node for node in self.pending if node not in blocks]:
+            del self.pending[node]
+
+        for node, node_path in blocks.items():
+            resting = not playing_back and (not physics_running or not island_manager.body_of(node).isActive())
+            if node in self.batched:
+                if not resting:
+                    self.release(node)
+            elif resting:
+                waited = self.pending.get(node, 0.0) + dt
+                if waited >= SETTLE_DELAY or not physics_running:
+                    self.pending.pop(node, None)
+                    self.capture(node, node_path, registry.info[node]['material'])
+                else:
+                    self.pending[node] = waited
+            else:
+                self.pending.pop(node, None)
+
+        for key in self.dirty:
+            self.rebuild(key)
+        self.dirty.clear()
+
+    def capture(self, node, node_path, material):
+        key = self.chunk_key(node_path, material)
+        self.batched[node] = (key, node_path)
+        self.members.setdefault(key, set()).add(node)
+        node_path.hide()
+        self.dirty.add(key)
+
+    def release(self, node, show=True):
+        key, node_path = self.batched.pop(node)
+        self.members[key].discard(node)
+        if show and not node_path.isEmpty():
+            node_path.show()
+        self.dirty.add(key)
+
+    def rebuild(self, key):
+        group = self.groups.pop(key, None)
+        if group is not None:
+            group.removeNode()
+
+        members = self.members.get(key)
+        if not members:
+            self.members.pop(key, None)
+            return
+
+        group = self.root.attachNewNode('batch')
+        render = self.main_app.render
+        for node in members:
+            visual = self.batched[node][1].find('visual')
+            copy = visual.copyTo(group)
+            copy.setTransform(visual.getTransform(render))
+        group.clearModelNodes()
+        group.flattenStrong()
+        self.groups[key] = group
+
+    def clear(self):
+        for node in list(self.batched):
+            self.release(node)
+        for group in self.groups.values():
+            group.removeNode()
+        self.groups = {}
+        self.members = {}
+        self.pending = {}
+        self.dirty.clear()
@@ -0,0 +1,63 @@
+import numpy as np
+
+# CONSTANTS
+SHAPES = ('cube', 'cone', 'sphere')
+SCENE_DTYPE = np.dtype([
+    ('position', '<f4', (3,)),
+    ('orientation', '<f4', (4,)),
+    ('shape', 'u1'),
+    ('size', '<f4'),
+    ('material', 'u1'),
+])
+
+
+# Scenes are a plain .npy file holding one SCENE_DTYPE record per block.
+# Orientation is a (w, x, y, z) quaternion and material is the index of the
+# material in MaterialManager.materials.
+def scene_records(main_app):
+    registry = main_app.body_registry
+    material_ids = {name: index for index, name in enumerate(main_app.material_manager.materials)}
+    shape_ids = {name: index for index, name in enumerate(SHAPES)}
+
+    blocks = registry.bodies['block']
+    info = registry.info
+    records = np.zeros(len(blocks), dtype=SCENE_DTYPE)
+    transforms = [node_path.getNetTransform() for node_path in blocks.values()]
+    block_info = [info[node] for node in blocks]
+    records['position'] = [tuple(transform.getPos()) for transform in transforms]
+    records['orientation'] = [tuple(transform.getQuat()) for transform in transforms]
+    records['shape'] = [shape_ids[item['shape_type']] for item in block_info]
+    records['size'] = [item['size'] for item in block_info]
+    records['material'] = [material_ids[item['material']] for item in block_info]
+    return records
+
+
+def save_scene(main_app, path):
+    np.save(path, scene_records(main_app))
+
+
+def open_scene(path, mmap=True):
+    records = np.load(path, mmap_mode='r' if mmap else None)
+    if records.dtype != SCENE_DTYPE:
+        raise ValueError(f"{path} is not a scene file")
+    return records
+
+
+def load_scene(main_app, path, mmap=True):
+    return add_records(main_app, open_scene(path, mmap))
+
+
+def add_records(main_app, records):
+    materials = list(main_app.material_manager.materials)
+    groups = np.stack([records['shape'].astype(np.float64), records['size'].astype(np.float64),
+                       records['material'].astype(np.float64)], axis=1)
+    keys, inverse = np.unique(groups, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    node_paths = []
+    for group, (shape, size, material) in enumerate(keys):
+        mask = inverse == group
+        node_paths.extend(main_app.add_blocks(np.asarray(records['position'][mask], dtype=np.float64),
+                                              np.asarray(records['orientation'][mask], dtype=np.float64),
+                                              SHAPES[int(shape)], materials[int(material)], float(size)))
+    return node_paths
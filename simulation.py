@@ -0,0 +1,358 @@
+import itertools
+import os
+import time
+
+from direct.showbase.ShowBase import ShowBase
+from direct.task import Task
+from panda3d.core import Vec3, Point3, Quat, NodePath, CardMaker, ClockObject, Filename, getModelPath, loadPrcFileData
+from panda3d.bullet import BulletWorld, BulletRigidBodyNode, BulletBoxShape, BulletDebugNode
+
+import materialManager
+import destructionManager
+import spatialIndex
+import bodyRegistry
+import physicsClock
+import activationPolicy
+import prototypeCache
+import renderBatcher
+import structureIslands
+import fractureManager
+import debrisManager
+import regionOfInterest
+import blastModel
+import particleSystem
+import earthquake
+import transformRecorder
+import occupancyGrid
+import frameProfiler
+import structureBuilder
+import collapseAnalytics
+import physicsThread
+
+# CONSTANTS
+PHYSICS_STEP = 1.0 / 60.0
+MAX_SUBSTEPS = 5
+# Runs after igLoop (sort 50) has drawn the frame.
+FIRST_FRAME_SORT = 52
+
+
+class Simulation(ShowBase):
+    def __init__(self, step_size=PHYSICS_STEP):
+        self.launch_time = time.perf_counter()
+        self.first_frame_time = None
+        loadPrcFileData('simulation', 'bullet-enable-contact-events true')
+        ShowBase.__init__(self)
+        getModelPath().prependDirectory(Filename.fromOsSpecific(os.path.dirname(os.path.abspath(__file__))))
+
+        self.current_block_size = 1.0
+        self.physics_enabled = False
+        self.physics_enabled_string = 'disabled'
+        self.selected_material = 'wood'
+        self.current_shape = 'cube'
+        self.placing_mode = 'building'
+
+        self.material_manager = materialManager.MaterialManager()
+        self.destruction_manager = destructionManager.DestructionManager(self)
+        self.spatial_index = spatialIndex.SpatialIndex()
+        self.prototype_cache = prototypeCache.PrototypeCache(self.loader)
+        self.prototype_cache.preload()
+
+        self.setup_physics()
+        self.fixed_step = True
+        self.stepper = physicsClock.FixedStepper(self.physics_world, step_size, MAX_SUBSTEPS)
+        self.stepper.add_step_callback(self.on_physics_step)
+        self.body_registry = bodyRegistry.BodyRegistry(self.physics_world, self.spatial_index)
+        self.activation_policy = activationPolicy.ActivationPolicy(self.body_registry, self.spatial_index)
+        self.occupancy_grid = occupancyGrid.OccupancyGrid(self.body_registry)
+        self.render_batcher = renderBatcher.RenderBatcher(self)
+        self.island_manager = structureIslands.IslandManager(self)
+        self.spatial_index.owner = self.island_manager.owner
+        self.fracture_manager = fractureManager.FractureManager(self)
+        self.debris_manager = debrisManager.DebrisManager(self)
+        self.region_of_interest = regionOfInterest.RegionOfInterest(self)
+        self.blast_model = blastModel.BlastModel(self)
+        self.particle_system = particleSystem.ParticleSystem(self)
+        self.earthquake = earthquake.EarthquakeEngine(self)
+        self.transform_recorder = transformRecorder.TransformRecorder(self)
+        self.transform_player = transformRecorder.TransformPlayer(self)
+        self.profiler = frameProfiler.FrameProfiler(self)
+        self.physics_thread = physicsThread.PhysicsThread(self)
+        self.collapse_analytics = collapseAnalytics.CollapseAnalytics(self)
+        self.add_plane()
+        self.taskMgr.add(self.on_first_frame, 'firstFrame', sort=FIRST_FRAME_SORT)
+
+    def on_first_frame(self, task):
+        self.first_frame_time = time.perf_counter() - self.launch_time
+        return Task.done
+
+    def setup_physics(self):
+        self.physics_world = self.make_physics_world()
+
+        self.debug_node = BulletDebugNode('Debug')
+        self.debug_node.showWireframe(True)
+        self.debug_node.showConstraints(True)
+        self.debug_node.showBoundingBoxes(False)
+        self.debug_np = self.render.attachNewNode(self.debug_node)
+
+        bullet_debug_np = BulletDebugNode('BulletDebug')
+        bullet_debug_np.showNormals(False)
+        bullet_debug_np.showWireframe(True)
+        bullet_debug_np.showConstraints(True)
+        bullet_debug_np.showBoundingBoxes(False)
+
+        self.physics_world.setDebugNode(bullet_debug_np)
+        self.bullet_debug_node = bullet_debug_np
+
+        self.debug_np.setPos(0, 0, 0)
+        self.debug_np.setHpr(0, 0, 0)
+
+    def make_physics_world(self):
+        physics_world = BulletWorld()
+        physics_world.setGravity(Vec3(0, 0, -9.81))
+        return physics_world
+
+    def add_plane(self):
+        plane_shape = BulletBoxShape(Vec3(10, 10, occupancyGrid.GROUND_TOP))
+        plane_node = BulletRigidBodyNode('Ground')
+        plane_node.addShape(plane_shape)
+        plane_node.setMass(0)
+        plane_node.setFriction(1.0)
+        plane_np = self.render.attachNewNode(plane_node)
+        plane_np.setPos(0, 0, 0)
+
+        self.physics_world.attachRigidBody(plane_node)
+        self.body_registry.register('ground', plane_np, plane_shape)
+
+        cm = CardMaker("ground")
+        cm.setFrame(-10, 10, -10, 10)
+        plane_visual = plane_np.attachNewNode(cm.generate())
+        plane_visual.setPos(0, 0, -0.1)
+        plane_visual.lookAt(0, 0, -1)
+        plane_visual.setColor(0, 1, 0.3, 1)
+
+    def make_block(self, shape_type, material, size):
+        shape = self.prototype_cache.get_shape(shape_type, size)
+        if shape is None:
+            return None
+
+        block_node = BulletRigidBodyNode('Box')
+
+        material_properties = self.material_manager.get_material_properties(material, size, shape_type)
+        mass = material_properties['mass']
+        friction = material_properties['friction']
+        restitution = material_properties['restitution']
+
+        block_node.setMass(mass)
+        block_node.addShape(shape)
+        block_node.setFriction(friction)
+        block_node.setRestitution(restitution)
+        self.activation_policy.configure(block_node, size, material_properties)
+
+        block_node.setLinearDamping(0.1)
+        block_node.setAngularDamping(0.1)
+
+        block_np = NodePath(block_node)
+
+        if shape_type == 'cone':
+            scale = Vec3(size / 2, size / 2, size)
+        else:
+            scale = Vec3(size, size, size)
+        self.prototype_cache.instance_model(shape_type, block_np, scale, state=self.material_manager.render_state(material))
+
+        return block_np, shape, {'shape_type': shape_type, 'size': size, 'material': material,
+                                 'material_id': self.material_manager.material_id(material), 'mass': mass}
+
+    def add_cube(self, position, shape_type=None, material=None, size=None):
+        if self.physics_thread.defer(self.add_cube, position, shape_type, material, size):
+            return None
+        if shape_type is None:
+            shape_type = self.current_shape
+        if material is None:
+            material = self.selected_material
+        if size is None:
+            size = self.current_block_size
+
+        block = self.make_block(shape_type, material, size)
+        if block is None:
+            return
+        block_np, shape, info = block
+
+        block_np.reparentTo(self.render)
+        block_np.setPos(position)
+
+        self.physics_world.attachRigidBody(block_np.node())
+        self.body_registry.register('block', block_np, shape, info)
+        self.occupancy_grid.add(block_np.node(), position, size)
+
+        return block_np
+
+    def add_blocks(self, positions, orientations=None, shape_type='cube', material='wood', size=1.0):
+        # Bulk variant of add_cube for blocks that share shape, material and
+        # size: the body is configured once and copied, and every copy
+        # instances the same visual node.
+        if self.physics_thread.defer(self.add_blocks, positions, orientations, shape_type, material, size):
+            return []
+        block = self.make_block(shape_type, material, size)
+        if block is None:
+            return []
+        prototype, shape, info = block
+
+        positions = positions.tolist() if hasattr(positions, 'tolist') else positions
+        if orientations is not None and hasattr(orientations, 'tolist'):
+            orientations = orientations.tolist()
+
+        prototype_node = prototype.node()
+        visual = prototype.find('visual')
+        render = self.render
+        attach = self.physics_world.attachRigidBody
+        register = self.body_registry.register
+        node_paths = []
+        for index, position in enumerate(positions):
+            block_np = render.attachNewNode(prototype_node.makeCopy())
+            visual.instanceTo(block_np)
+            if orientations is None:
+                block_np.setPos(*position)
+            else:
+                block_np.setPosQuat(Point3(*position), Quat(*orientations[index]))
+            attach(block_np.node())
+            register('block', block_np, shape, info)
+            node_paths.append(block_np)
+        self.occupancy_grid.mark_dirty()
+        return node_paths
+
+    def pick_cell(self, from_pos, to_pos, size):
+        result = self.physics_world.rayTestClosest(from_pos, to_pos)
+        if not result.hasHit():
+            return None
+
+        # Step half a block out along the hit normal so the snapped cell sits
+        # against the face that was hit rather than inside the body. Courses
+        # start on the ground's top face, where settled blocks come to rest.
+        center = result.getHitPos() + result.getHitNormal() * (size / 2)
+        ground_top = occupancyGrid.GROUND_TOP
+        snapped_x = round(center.getX() / size) * size
+        snapped_y = round(center.getY() / size) * size
+        snapped_z = round((center.getZ() - size / 2 - ground_top) / size) * size + size / 2 + ground_top
+        return Point3(snapped_x, snapped_y, snapped_z)
+
+    def clear_blocks(self):
+        if self.physics_thread.defer(self.clear_blocks):
+            return
+        self.blast_model.clear()
+        self.island_manager.fracture_all()
+        self.fracture_manager.clear()
+        self.debris_manager.clear()
+        self.region_of_interest.forget()
+        self.particle_system.clear()
+        self.body_registry.reset()
+        self.occupancy_grid.mark_dirty()
+        self.render_batcher.refresh()
+
+    def reset_scene(self):
+        if self.physics_thread.defer(self.reset_scene):
+            return
+        self.earthquake.stop()
+        self.blast_model.clear()
+        self.island_manager.forget()
+        self.fracture_manager.forget()
+        self.debris_manager.clear()
+        self.region_of_interest.forget()
+        self.particle_system.clear()
+        self.placing_mode = 'building'
+        self.stepper.reset()
+
+        # A fresh BulletWorld drops broadphase and solver state left over from
+        # earlier runs, and a fresh ground drops the velocity and activation a
+        # ground-mode earthquake leaves on it, so the same scene and seed
+        # always replay identically. The old world is dropped whole instead
+        # of removing its bodies one at a time.
+        self.body_registry.teardown()
+        self.physics_world = self.make_physics_world()
+        self.physics_world.setDebugNode(self.bullet_debug_node)
+        self.stepper.physics_world = self.physics_world
+        self.body_registry.physics_world = self.physics_world
+        self.add_plane()
+        self.occupancy_grid.mark_dirty()
+        self.render_batcher.refresh()
+
+    def on_physics_step(self, dt):
+        self.spatial_index.mark_moved()
+        self.occupancy_grid.mark_moved(itertools.compress(self.spatial_index.nodes, self.spatial_index.awake))
+        self.blast_model.on_physics_step(dt)
+        self.island_manager.on_physics_step(dt)
+        self.fracture_manager.on_physics_step(dt)
+        self.debris_manager.on_physics_step(dt)
+        self.region_of_interest.on_physics_step(dt)
+        self.earthquake.on_physics_step(dt)
+        self.collapse_analytics.on_physics_step(dt)
+        self.transform_recorder.on_physics_step(dt)
+
+    def step_physics(self, dt):
+        if self.physics_thread.running:
+            self.physics_thread.advance(dt)
+            return 0
+        if self.fixed_step:
+            return self.stepper.advance(dt)
+        self.physics_world.doPhysics(dt)
+        self.on_physics_step(dt)
+        return 1
+
+
+class HeadlessSimulation(Simulation):
+    # Runs the same scene code as the interactive app without a window.
+    # Physics and the earthquake run from the fixed stepper; the global clock
+    # is switched to non-real-time so tasks run by taskMgr.step() also see
+    # exactly one physics step pass per step().
+    def __init__(self, step_size=PHYSICS_STEP):
+        loadPrcFileData('headless', 'window-type none')
+        loadPrcFileData('headless', 'audio-library-name null')
+
+        Simulation.__init__(self, step_size)
+
+        clock = ClockObject.getGlobalClock()
+        clock.setMode(ClockObject.MNonRealTime)
+        clock.setFrameRate(1.0 / step_size)
+
+        self.step_size = step_size
+        self.physics_enabled = True
+        self.physics_enabled_string = 'enabled'
+
+    def add_block(self, position, shape_type='cube', material='wood', size=1.0):
+        return self.add_cube(Vec3(*position), shape_type, material, size)
+
+    def build_structure(self, layout, origin=(0.0, 0.0, 0.0), size=1.0, materials=('stone',), **params):
+        return structureBuilder.build(self, layout, origin, size, materials, **params)
+
+    def trigger_explosion(self, position, force=100.0, radius=5.0, shockwave_speed=None):
+        self.destruction_manager.trigger_explosion(Vec3(*position), force, radius, shockwave_speed)
+
+    def drop_heavy_ball(self, position, height=10.0):
+        self.destruction_manager.drop_heavy_ball(Vec3(*position), height)
+
+    def add_wrecking_ball(self):
+        self.destruction_manager.add_wrecking_ball()
+
+    def trigger_earthquake(self, magnitude=10, duration=5, seed=None, mode='ground'):
+        self.destruction_manager.trigger_earthquake(magnitude, duration, seed, mode)
+
+    def step(self, count=1):
+        profiler = self.profiler
+        for _ in range(count):
+            profiler.begin('physics')
+            self.stepper.step()
+            profiler.end('physics')
+            profiler.begin('tasks')
+            self.taskMgr.step()
+            profiler.end('tasks')
+            profiler.end_frame()
+
+    def run_for(self, seconds):
+        self.step(int(round(seconds / self.step_size)))
+
+    @property
+    def step_count(self):
+        return self.stepper.step_count
+
+    @property
+    def sim_time(self):
+        return self.stepper.sim_time
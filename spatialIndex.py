@@ -0,0 +1,164 @@
+import numpy as np
+from panda3d.bullet import BulletRigidBodyNode
+
+
+class SpatialIndex:
+    # Uniform grid over the dynamic bodies in the scene. Positions are pulled
+    # into one array and sorted by cell key when bodies are added or removed.
+    # Every physics step ORs the bodies that are awake into a pending mask,
+    # and the next query reads back only those rows, so a body that woke and
+    # fell asleep again between two queries is still re-read. A resting
+    # structure costs one isActive call per body per step (through map, not
+    # Python code) and no scene graph reads. owner maps island members to the
+    # island body whose activation they follow.
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.node_paths = []
+        self.nodes = []
+        self.slots = {}
+        self.positions = np.zeros((0, 3))
+        self.dirty = True
+        self.moved = False
+        self.pending = np.zeros(0, dtype=bool)
+        self.awake = np.zeros(0, dtype=bool)
+        self.any_awake = True
+        self.owner = {}
+
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+        self.origin = np.zeros(3, dtype=np.int64)
+        self.dims = np.ones(3, dtype=np.int64)
+
+    def add(self, node_path):
+        node = node_path.node()
+        if node in self.slots:
+            return
+        self.slots[node] = len(self.node_paths)
+        self.node_paths.append(node_path)
+        self.nodes.append(node)
+        self.dirty = True
+
+    def remove(self, node_path):
+        slot = self.slots.pop(node_path.node(), None)
+        if slot is None:
+            return
+        last = self.node_paths.pop()
+        last_node = self.nodes.pop()
+        if slot < len(self.node_paths):
+            self.node_paths[slot] = last
+            self.nodes[slot] = last_node
+            self.slots[last_node] = slot
+        self.dirty = True
+
+    def clear(self):
+        self.node_paths = []
+        self.nodes = []
+        self.slots = {}
+        self.positions = np.zeros((0, 3))
+        self.dirty = True
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def mark_moved(self):
+        # awake (parallel to nodes) and any_awake let other per-step work
+        # follow the same activation. A pending rebuild reads every row anyway.
+        awake = self.awake = self.awake_mask()
+        self.any_awake = bool(awake.any())
+        if self.dirty:
+            return
+        self.pending |= awake
+        self.moved = True
+
+    def awake_mask(self):
+        owner = self.owner
+        nodes = self.nodes
+        bodies = map(owner.get, nodes, nodes) if owner else nodes
+        return np.fromiter(map(BulletRigidBodyNode.isActive, bodies), dtype=bool, count=len(nodes))
+
+    def rebuild(self):
+        count = len(self.node_paths)
+        self.positions = np.array([tuple(node_path.getNetTransform().getPos()) for node_path in self.node_paths], dtype=np.float64).reshape(count, 3)
+        self.pending = np.zeros(count, dtype=bool)
+        self.moved = False
+        self.sort()
+
+    def refresh(self):
+        slots = np.flatnonzero(self.pending)
+        self.pending[slots] = False
+        self.moved = False
+        if len(slots) == 0:
+            return
+        node_paths = self.node_paths
+        self.positions[slots] = np.array([tuple(node_paths[slot].getNetTransform().getPos()) for slot in slots.tolist()],
+                                         dtype=np.float64)
+        self.sort()
+
+    def sort(self):
+        count = len(self.node_paths)
+        if count == 0:
+            self.order = np.zeros(0, dtype=np.int64)
+            self.sorted_keys = np.zeros(0, dtype=np.int64)
+            self.dirty = False
+            return
+
+        cells = np.floor(self.positions / self.cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0)
+        self.dims = cells.max(axis=0) - self.origin + 1
+
+        keys = self._keys(cells - self.origin)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        self.dirty = False
+
+    def _keys(self, cells):
+        return (cells[..., 0] * self.dims[1] + cells[..., 1]) * self.dims[2] + cells[..., 2]
+
+    def update(self):
+        if self.dirty:
+            self.rebuild()
+        elif self.moved:
+            self.refresh()
+
+    def max_error(self):
+        # Largest distance between a cached position and the body's actual
+        # position, for checking that no moved body was missed.
+        self.update()
+        if not self.node_paths:
+            return 0.0
+        actual = np.array([tuple(node_path.getNetTransform().getPos()) for node_path in self.node_paths], dtype=np.float64)
+        return float(np.linalg.norm(actual - self.positions, axis=1).max())
+
+    def query_radius(self, position, radius):
+        self.update()
+
+        center = np.array([position[0], position[1], position[2]], dtype=np.float64)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros((0, 3)), np.zeros(0))
+        if len(self.node_paths) == 0:
+            return empty
+
+        low = np.floor((center - radius) / self.cell_size).astype(np.int64) - self.origin
+        high = np.floor((center + radius) / self.cell_size).astype(np.int64) - self.origin
+        low = np.maximum(low, 0)
+        high = np.minimum(high, self.dims - 1)
+        if np.any(low > high):
+            return empty
+
+        # Cells are ordered z-fastest, so every (x, y) column of the query box
+        # is one contiguous key range in the sorted array.
+        xs, ys = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1), indexing='ij')
+        column_base = (xs.ravel() * self.dims[1] + ys.ravel()) * self.dims[2]
+        starts = np.searchsorted(self.sorted_keys, column_base + low[2], side='left')
+        ends = np.searchsorted(self.sorted_keys, column_base + high[2], side='right')
+
+        counts = ends - starts
+        total = int(counts.sum())
+        if total == 0:
+            return empty
+        run_offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        candidates = self.order[run_offsets + np.arange(total)]
+
+        offsets = self.positions[candidates] - center
+        distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+        inside = distances < radius
+        return candidates[inside], offsets[inside], distances[inside]
@@ -0,0 +1,120 @@
+import numpy as np
+
+import occupancyGrid
+
+# CONSTANTS
+BONDS = ('stack', 'running')
+BAY_WIDTH = 3
+STORY_HEIGHT = 3
+
+
+# Layouts return (cells, layers): cells is an (N, 3) array of block centres
+# in block units around the origin, with z the course index, and layers is
+# the layer each block takes its material from. Cells sit on whole blocks so
+# they land on the same grid as clicked blocks; only running-bond courses are
+# shifted by half a block.
+def centred(count):
+    return np.arange(count, dtype=np.float64) - (count - 1) // 2
+
+
+def wall(length=16, height=8, bond='running', thickness=1):
+    if bond not in BONDS:
+        raise ValueError(f"unknown bond '{bond}'")
+    x, y, z = np.meshgrid(centred(length), centred(thickness), np.arange(height), indexing='ij')
+    cells = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    if bond == 'running':
+        # Every other course shifts half a block and drops its last block so
+        # both ends of the wall stay flush.
+        odd = cells[:, 2] % 2 == 1
+        cells[odd, 0] += 0.5
+        cells = cells[~odd | (cells[:, 0] < centred(length)[-1])]
+    return cells, cells[:, 2].astype(np.int64)
+
+
+def tower(width=3, depth=3, height=20):
+    x, y, z = np.meshgrid(centred(width), centred(depth), np.arange(height), indexing='ij')
+    cells = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    return cells, cells[:, 2].astype(np.int64)
+
+
+def floor(width=10, depth=10, level=0):
+    cells, _ = tower(width, depth, 1)
+    cells[:, 2] = level
+    return cells, np.full(len(cells), level, dtype=np.int64)
+
+
+def pyramid(base=10):
+    # A step pyramid: each level is one block in from the edge on every
+    # side, so every level stays centred on the grid.
+    parts = []
+    for level in range((base + 1) // 2):
+        cells, _ = tower(base - 2 * level, base - 2 * level, 1)
+        cells[:, 2] = level
+        parts.append(cells)
+    cells = np.concatenate(parts)
+    return cells, cells[:, 2].astype(np.int64)
+
+
+def frame(bays_x=3, bays_y=3, stories=3, bay_width=BAY_WIDTH, story_height=STORY_HEIGHT, floors=True):
+    # Columns at every bay corner, story_height - 1 blocks tall, under a
+    # floor slab (or perimeter and grid-line beams only) at the top of each
+    # story. Layers count stories, so materials change per story.
+    width = bays_x * bay_width + 1
+    depth = bays_y * bay_width + 1
+    x, y = np.meshgrid(np.arange(width), np.arange(depth), indexing='ij')
+    x = x.ravel()
+    y = y.ravel()
+    columns = (x % bay_width == 0) & (y % bay_width == 0)
+    beams = (x % bay_width == 0) | (y % bay_width == 0)
+    slab = np.ones_like(columns) if floors else beams
+
+    parts = []
+    layers = []
+    for story in range(stories):
+        base = story * story_height
+        story_parts = [np.stack([x[columns], y[columns], np.full(columns.sum(), base + level)], axis=1)
+                       for level in range(story_height - 1)]
+        story_parts.append(np.stack([x[slab], y[slab], np.full(slab.sum(), base + story_height - 1)], axis=1))
+        parts.extend(story_parts)
+        layers.append(np.full(sum(len(part) for part in story_parts), story))
+    cells = np.concatenate(parts).astype(np.float64)
+    cells[:, :2] -= [(width - 1) // 2, (depth - 1) // 2]
+    return cells, np.concatenate(layers)
+
+
+LAYOUTS = {
+    'wall': wall,
+    'tower': tower,
+    'floor': floor,
+    'pyramid': pyramid,
+    'frame': frame,
+}
+
+
+def snap_origin(origin, size):
+    # Same grid as Simulation.pick_cell: x and y on multiples of the block
+    # size, z on the bottom face of a course counted from the ground's top.
+    ground_top = occupancyGrid.GROUND_TOP
+    return np.array([round(origin[0] / size) * size, round(origin[1] / size) * size,
+                     round((origin[2] - ground_top) / size) * size + ground_top])
+
+
+def build(main_app, layout, origin=(0.0, 0.0, 0.0), size=1.0, materials=('stone',), shape_type='cube', **params):
+    # Lays out a structure and creates it with one add_blocks call per
+    # material, so every body of a material shares one prototype and is
+    # attached to the BulletWorld in a single pass. materials cycle by layer.
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout '{layout}'")
+    for material in materials:
+        if material not in main_app.material_manager.materials:
+            raise ValueError(f"unknown material '{material}'")
+
+    cells, layers = LAYOUTS[layout](**params)
+    positions = snap_origin(origin, size) + (cells + [0.0, 0.0, 0.5]) * size
+    material_index = layers % len(materials)
+    node_paths = []
+    for index, material in enumerate(materials):
+        mask = material_index == index
+        if mask.any():
+            node_paths.extend(main_app.add_blocks(positions[mask], None, shape_type, material, size))
+    return node_paths
@@ -0,0 +1,228 @@
+from panda3d.core import Vec3, Point3, TransformState
+from panda3d.bullet import BulletRigidBodyNode
+
+# CONSTANTS
+MERGE_INTERVAL = 1.0
+MIN_ISLAND_SIZE = 4
+FRACTURE_DELTA_V = 0.5
+
+
+class IslandManager:
+    # Collapses groups of touching, resting blocks into one compound rigid
+    # body so the solver sees one body instead of every block-on-block contact.
+    # Member blocks keep their own nodes: they are detached from the world and
+    # parented under the island, then re-attached when the island fractures.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.enabled = False
+        self.islands = {}
+        self.owner = {}
+        self.elapsed = 0.0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.fracture_all()
+
+    def body_of(self, node):
+        island = self.owner.get(node)
+        if island is None:
+            return node
+        return island
+
+    def on_physics_step(self, dt):
+        if not self.enabled:
+            return
+
+        if self.islands:
+            self.check_contacts()
+
+        self.elapsed += dt
+        if self.elapsed >= MERGE_INTERVAL:
+            self.elapsed = 0.0
+            self.merge()
+
+    def find_groups(self):
+        blocks = self.main_app.body_registry.bodies['block']
+        parent = {}
+
+        def find(node):
+            root = node
+            while parent[root] is not root:
+                root = parent[root]
+            while parent[node] is not root:
+                parent[node], node = root, parent[node]
+            return root
+
+        for manifold in self.main_app.physics_world.getManifolds():
+            if manifold.getNumManifoldPoints() == 0:
+                continue
+            node0 = manifold.getNode0()
+            node1 = manifold.getNode1()
+            if node0 not in blocks or node1 not in blocks:
+                continue
+            if node0.isActive() or node1.isActive() or node0.isStatic() or node1.isStatic():
+                continue
+            parent.setdefault(node0, node0)
+            parent.setdefault(node1, node1)
+            root0 = find(node0)
+            root1 = find(node1)
+            if root0 is not root1:
+                parent[root1] = root0
+
+        groups = {}
+        for node in parent:
+            groups.setdefault(find(node), []).append(node)
+        return [group for group in groups.values() if len(group) >= MIN_ISLAND_SIZE]
+
+    def merge(self):
+        for group in self.find_groups():
+            self.create_island(group)
+
+    def create_island(self, members):
+        main_app = self.main_app
+        registry = main_app.body_registry
+
+        total_mass = 0.0
+        center = Vec3(0, 0, 0)
+        friction = 0.0
+        restitution = 0.0
+        for node in members:
+            mass = node.getMass()
+            total_mass += mass
+            center += Vec3(registry.bodies['block'][node].getPos(main_app.render)) * mass
+            friction += node.getFriction()
+            restitution += node.getRestitution()
+        center /= total_mass
+
+        island_node = BulletRigidBodyNode('Island')
+        island_np = main_app.render.attachNewNode(island_node)
+        island_np.setPos(center)
+
+        for node in members:
+            node_path = registry.bodies['block'][node]
+            main_app.physics_world.removeRigidBody(node)
+            node_path.wrtReparentTo(island_np)
+            island_node.addShape(registry.shapes[node], TransformState.makePosQuatScale(node_path.getPos(), node_path.getQuat(), Vec3(1, 1, 1)))
+            self.owner[node] = island_node
+
+        island_node.setMass(total_mass)
+        island_node.setFriction(friction / len(members))
+        island_node.setRestitution(restitution / len(members))
+        island_node.setLinearDamping(0.1)
+        island_node.setAngularDamping(0.1)
+        island_node.setDeactivationTime(members[0].getDeactivationTime())
+        island_node.setLinearSleepThreshold(members[0].getLinearSleepThreshold())
+        island_node.setAngularSleepThreshold(members[0].getAngularSleepThreshold())
+
+        main_app.physics_world.attachRigidBody(island_node)
+        island_node.setActive(False, True)
+
+        registry.register('island', island_np)
+        self.islands[island_node] = (island_np, list(members))
+        return island_np
+
+    def fracture(self, island_node):
+        main_app = self.main_app
+        registry = main_app.body_registry
+        island_np, members = self.islands.pop(island_node)
+
+        linear_velocity = island_node.getLinearVelocity()
+        angular_velocity = island_node.getAngularVelocity()
+        center = island_np.getPos(main_app.render)
+
+        for node in members:
+            del self.owner[node]
+            node_path = registry.bodies['block'][node]
+            node_path.wrtReparentTo(main_app.render)
+            main_app.physics_world.attachRigidBody(node)
+            offset = node_path.getPos() - center
+            node.setLinearVelocity(linear_velocity + angular_velocity.cross(offset))
+            node.setAngularVelocity(angular_velocity)
+            node.setActive(True, True)
+
+        registry.remove(island_np)
+        return members
+
+    def remove(self, island_node):
+        # Drops an island together with its members, for one that left the
+        # world. Members are not in the world, so they are only unregistered.
+        registry = self.main_app.body_registry
+        island_np, members = self.islands.pop(island_node)
+        for node in members:
+            del self.owner[node]
+            node_path = registry.bodies['block'][node]
+            registry.unregister(node_path)
+            node_path.removeNode()
+        registry.remove(island_np)
+
+    def fracture_all(self):
+        for island_node in list(self.islands):
+            self.fracture(island_node)
+
+    def forget(self):
+        # For a world that is thrown away whole: members are not re-attached.
+        # owner is shared with the spatial index, so it is emptied in place.
+        self.islands = {}
+        self.owner.clear()
+        self.elapsed = 0.0
+
+    def check_contacts(self):
+        # Contacts fracture an island when they change its velocity by more
+        # than FRACTURE_DELTA_V in one step. Measured per unit of island mass,
+        # the ground holding an island up (g * dt) never counts as a hit.
+        struck = set()
+        for manifold in self.main_app.physics_world.getManifolds():
+            node0 = manifold.getNode0()
+            node1 = manifold.getNode1()
+            island = node0 if node0 in self.islands else node1 if node1 in self.islands else None
+            if island is None or not island.isActive():
+                continue
+            impulse = sum(point.getAppliedImpulse() for point in manifold.getManifoldPoints())
+            if impulse / island.getMass() > FRACTURE_DELTA_V:
+                struck.add(island)
+        for island in struck:
+            self.fracture(island)
+
+    def disturb(self, nodes, impulses):
+        # Called before impulses are applied to individual blocks. Islands that
+        # would receive a per-block velocity change over the threshold fracture
+        # and the impulse then goes to the freed blocks; weaker hits are
+        # applied to the island as a whole.
+        if not self.islands:
+            return nodes, impulses
+
+        hits = {}
+        free_nodes = []
+        free_impulses = []
+        for node, impulse in zip(nodes, impulses):
+            island = self.owner.get(node)
+            if island is None:
+                free_nodes.append(node)
+                free_impulses.append(impulse)
+            else:
+                hits.setdefault(island, []).append((node, impulse))
+
+        for island, island_hits in hits.items():
+            strongest = max(impulse.length() / node.getMass() for node, impulse in island_hits)
+            if strongest > FRACTURE_DELTA_V:
+                self.fracture(island)
+                for node, impulse in island_hits:
+                    free_nodes.append(node)
+                    free_impulses.append(impulse)
+            else:
+                render = self.main_app.render
+                center = self.islands[island][0].getPos(render)
+                island.setActive(True, True)
+                for node, impulse in island_hits:
+                    node_path = self.main_app.body_registry.bodies['block'][node]
+                    island.applyImpulse(impulse, Point3(node_path.getPos(render) - center))
+
+        return free_nodes, free_impulses
+
+    def disturb_all(self, delta_v):
+        for island_node in list(self.islands):
+            if delta_v > FRACTURE_DELTA_V:
+                self.fracture(island_node)
+            else:
+                island_node.setActive(True, True)
@@ -0,0 +1,176 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import sceneFile
+
+# CONSTANTS
+SETTLE_TIME = 2.0
+RUN_TIME = 8.0
+DISPLACED_DISTANCE = 0.5
+CHECK_REPEATS = 3
+EVENTS = ('explosion', 'heavy_ball', 'earthquake', 'wrecking_ball')
+DEFAULT_RANGES = {
+    'explosion': {'x': (-2.0, 2.0), 'y': (-2.0, 2.0), 'z': (0.5, 3.0), 'force': (50.0, 500.0), 'radius': (2.0, 8.0)},
+    'heavy_ball': {'x': (-2.0, 2.0), 'y': (-2.0, 2.0), 'height': (5.0, 20.0)},
+    'earthquake': {'magnitude': (2.0, 20.0), 'duration': (2.0, 6.0)},
+    'wrecking_ball': {},
+}
+
+_simulation = None
+
+
+def load_scene(path):
+    if path.endswith('.npy'):
+        return np.array(sceneFile.open_scene(path, mmap=False))
+    with open(path) as scene_file:
+        return json.load(scene_file)['blocks']
+
+
+def grid_parameters(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_parameters(ranges, samples, seed):
+    rng = np.random.default_rng(seed)
+    return [{name: float(rng.uniform(low, high)) for name, (low, high) in ranges.items()} for _ in range(samples)]
+
+
+def _init_worker():
+    global _simulation
+    from simulation import HeadlessSimulation
+    _simulation = HeadlessSimulation()
+
+
+def _apply_event(sim, event, params):
+    if event == 'explosion':
+        sim.trigger_explosion((params.get('x', 0.0), params.get('y', 0.0), params.get('z', 1.0)),
+                              params.get('force', 100.0), params.get('radius', 5.0), params.get('shockwave_speed'))
+    elif event == 'heavy_ball':
+        sim.drop_heavy_ball((params.get('x', 0.0), params.get('y', 0.0), 0.0), params.get('height', 10.0))
+    elif event == 'earthquake':
+        sim.trigger_earthquake(params.get('magnitude', 10), params.get('duration', 5))
+    elif event == 'wrecking_ball':
+        sim.add_wrecking_ball()
+    else:
+        raise ValueError(f"unknown event '{event}'")
+
+
+def run_scenario(scene, event, params, seed, settle_time=SETTLE_TIME, run_time=RUN_TIME):
+    sim = _simulation
+    np.random.seed(seed)
+    start = time.perf_counter()
+
+    sim.reset_scene()
+    if isinstance(scene, np.ndarray):
+        sceneFile.add_records(sim, scene)
+    else:
+        for block in scene:
+            sim.add_block(block['position'], block.get('shape', 'cube'), block.get('material', 'wood'), block.get('size', 1.0))
+    blocks = sim.body_registry.get('block')
+    placed = np.array([tuple(block.getPos()) for block in blocks]).reshape(len(blocks), 3)
+
+    sim.run_for(settle_time)
+    _apply_event(sim, event, params)
+    sim.run_for(run_time)
+
+    final = np.array([tuple(block.getNetTransform().getPos()) for block in blocks]).reshape(len(blocks), 3)
+    displaced = np.linalg.norm(final - placed, axis=1) > DISPLACED_DISTANCE
+    return {
+        'seed': seed,
+        'blocks': len(blocks),
+        'blocks_displaced': int(displaced.sum()),
+        'fraction_displaced': float(displaced.mean()) if len(blocks) else 0.0,
+        'max_height': float(final[:, 2].max()) if len(blocks) else 0.0,
+        'wall_time': time.perf_counter() - start,
+    }
+
+
+def _run(job):
+    scene, event, params, seed, settle_time, run_time = job
+    result = run_scenario(scene, event, params, seed, settle_time, run_time)
+    result.update(params)
+    return result
+
+
+def _repeat(job):
+    scene, event, params, seed, settle_time, run_time, repeats = job
+    return [run_scenario(scene, event, params, seed, settle_time, run_time) for _ in range(repeats)]
+
+
+def check_repeatable(scene, event, params, seed=0, repeats=CHECK_REPEATS, settle_time=SETTLE_TIME, run_time=RUN_TIME):
+    # Runs one job several times in the same worker, the way a pool reuses a
+    # simulation across jobs. Returns the metrics that differed between runs;
+    # any state a run leaks into the next one shows up here.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker) as pool:
+        results = pool.submit(_repeat, (scene, event, params, seed, settle_time, run_time, repeats)).result()
+    return [name for name in results[0]
+            if name != 'wall_time' and any(result[name] != results[0][name] for result in results[1:])]
+
+
+def run_sweep(scene, event, parameter_sets, seed=0, workers=None, settle_time=SETTLE_TIME, run_time=RUN_TIME):
+    jobs = [(scene, event, params, seed + index, settle_time, run_time) for index, params in enumerate(parameter_sets)]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        results = list(pool.map(_run, jobs))
+
+    columns = {}
+    for name in results[0] if results else []:
+        columns[name] = np.array([result[name] for result in results])
+    return columns
+
+
+def save_results(path, columns):
+    np.savez(path, **columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a demolition parameter sweep across CPU cores.')
+    parser.add_argument('scene', help='.npy scene file, or JSON scene file with a "blocks" list')
+    parser.add_argument('--event', choices=EVENTS, default='explosion')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help='grid values for one event parameter (repeatable)')
+    parser.add_argument('--samples', type=int, default=0, help='random samples from the default ranges instead of a grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--settle-time', type=float, default=SETTLE_TIME)
+    parser.add_argument('--run-time', type=float, default=RUN_TIME)
+    parser.add_argument('--output', default='sweep_results.npz')
+    parser.add_argument('--check', action='store_true',
+                        help='first rerun the first parameter set in one worker and stop if the runs differ')
+    args = parser.parse_args()
+
+    if args.samples:
+        parameter_sets = random_parameters(DEFAULT_RANGES[args.event], args.samples, args.seed)
+    else:
+        grid = {}
+        for param in args.param:
+            name, values = param.split('=', 1)
+            grid[name] = [float(value) for value in values.split(',')]
+        parameter_sets = grid_parameters(grid)
+
+    scene = load_scene(args.scene)
+    if args.check and parameter_sets:
+        mismatches = check_repeatable(scene, args.event, parameter_sets[0], args.seed,
+                                      settle_time=args.settle_time, run_time=args.run_time)
+        if mismatches:
+            print(f"NOT REPEATABLE: {', '.join(mismatches)} differ between runs with seed {args.seed}")
+            sys.exit(1)
+        print(f"{CHECK_REPEATS} repeated runs matched")
+
+    columns = run_sweep(scene, args.event, parameter_sets, args.seed, args.workers,
+                        args.settle_time, args.run_time)
+    save_results(args.output, columns)
+    print(f"{len(parameter_sets)} runs written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import bisect
+import struct
+
+import numpy as np
+from panda3d.core import Point3, Quat
+
+# CONSTANTS
+RECORDING_MAGIC = b'DTRC'
+RECORDING_VERSION = 2
+HEADER_FORMAT = '<4sIf'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+CHUNK_FORMAT = '<II'
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_FORMAT)
+BUFFER_FRAMES = 600
+TRANSFORM_WIDTH = 7
+
+
+# A recording is a 12-byte header (magic, version, step size) followed by
+# chunks. Each chunk is a (frame count, body count) header, an int32 body id
+# per body, then float32 frames of shape (body count, 7): x, y, z and a
+# (w, x, y, z) quaternion per body. A new chunk starts whenever bodies are
+# added or removed, and ids index the recorder's node_paths.
+def open_recording(path):
+    with open(path, 'rb') as recording_file:
+        magic, version, step_size = struct.unpack(HEADER_FORMAT, recording_file.read(HEADER_SIZE))
+    if magic != RECORDING_MAGIC:
+        raise ValueError(f"{path} is not a transform recording")
+    if version != RECORDING_VERSION:
+        raise ValueError(f"{path} is a version {version} recording, expected {RECORDING_VERSION}")
+
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    chunks = []
+    offset = HEADER_SIZE
+    while offset + CHUNK_HEADER_SIZE <= len(data):
+        frame_count, body_count = struct.unpack_from(CHUNK_FORMAT, data, offset)
+        offset += CHUNK_HEADER_SIZE
+        ids = data[offset:offset + 4 * body_count].view('<i4')
+        offset += 4 * body_count
+        size = frame_count * body_count * TRANSFORM_WIDTH * 4
+        if offset + size > len(data):
+            raise ValueError(f"{path} is truncated")
+        frames = data[offset:offset + size].view('<f4').reshape(frame_count, body_count, TRANSFORM_WIDTH)
+        offset += size
+        chunks.append((ids, frames))
+    return chunks, step_size
+
+
+class TransformRecorder:
+    # Writes every dynamic body's transform into a preallocated buffer once
+    # per fixed step and streams the buffer to disk as a chunk whenever it
+    # fills or the registry's bodies change. Each body gets an id the first
+    # time it is seen; node_paths keeps them after stop() so the player can
+    # map rows back to the same bodies, including ones spawned mid-recording.
+    def __init__(self, main_app, buffer_frames=BUFFER_FRAMES):
+        self.main_app = main_app
+        self.buffer_frames = buffer_frames
+        self.recording = False
+        self.path = None
+        self.node_paths = []
+        self.ids = {}
+        self.chunk_paths = []
+        self.chunk_ids = np.zeros(0, dtype='<i4')
+        self.registry_version = None
+        self.buffer = None
+        self.slot = 0
+        self.frames_written = 0
+        self.output = None
+
+    def start(self, path):
+        if self.recording:
+            self.stop()
+        self.path = path
+        self.node_paths = []
+        self.ids = {}
+        self.registry_version = None
+        self.slot = 0
+        self.frames_written = 0
+        self.output = open(path, 'wb')
+        self.output.write(struct.pack(HEADER_FORMAT, RECORDING_MAGIC, RECORDING_VERSION, self.main_app.stepper.step_size))
+        self.recording = True
+        self.capture()
+
+    def begin_chunk(self):
+        self.flush()
+        registry = self.main_app.body_registry
+        ids = self.ids
+        node_paths = registry.dynamic_bodies()
+        for node_path in node_paths:
+            node = node_path.node()
+            if node not in ids:
+                ids[node] = len(self.node_paths)
+                self.node_paths.append(node_path)
+        self.chunk_paths = node_paths
+        self.chunk_ids = np.array([ids[node_path.node()] for node_path in node_paths], dtype='<i4')
+        if self.buffer is None or self.buffer.shape[1] != len(node_paths):
+            self.buffer = np.zeros((self.buffer_frames, len(node_paths), TRANSFORM_WIDTH), dtype='<f4')
+        self.registry_version = registry.version
+
+    def capture(self):
+        if self.main_app.body_registry.version != self.registry_version:
+            self.begin_chunk()
+        frame = self.buffer[self.slot]
+        for index, node_path in enumerate(self.chunk_paths):
+            transform = node_path.getNetTransform()
+            row = frame[index]
+            row[0:3] = transform.getPos()
+            row[3:7] = transform.getQuat()
+        self.slot += 1
+        if self.slot == self.buffer_frames:
+            self.flush()
+
+    def flush(self):
+        if self.slot:
+            self.output.write(struct.pack(CHUNK_FORMAT, self.slot, len(self.chunk_ids)))
+            self.output.write(self.chunk_ids.tobytes())
+            self.output.write(self.buffer[:self.slot].tobytes())
+            self.frames_written += self.slot
+            self.slot = 0
+
+    def stop(self):
+        if not self.recording:
+            return
+        self.flush()
+        self.output.close()
+        self.output = None
+        self.recording = False
+
+    def on_physics_step(self, dt):
+        if self.recording:
+            self.capture()
+
+
+class TransformPlayer:
+    # Replays a recording by writing its transforms back to the bodies the
+    # recorder saw, without stepping physics. Bodies missing from the chunk
+    # being shown (spawned later or removed earlier) are stashed, and pooled
+    # fragments that were live at the time are put back in the scene until
+    # stop(). Frames are memory-mapped, so scrubbing through a long recording
+    # only touches the pages that are shown.
+    def __init__(self, main_app):
+        self.main_app = main_app
+        self.chunks = []
+        self.starts = []
+        self.frame_count = 0
+        self.step_size = 0.0
+        self.node_paths = []
+        self.chunk = None
+        self.stashed = set()
+        self.borrowed = set()
+        self.playing = False
+        self.frame = 0
+        self.elapsed = 0.0
+        self.physics_was_enabled = False
+
+    def start(self, path):
+        chunks, step_size = open_recording(path)
+        recorder = self.main_app.transform_recorder
+        if recorder.path != path:
+            raise ValueError(f"{path} was not recorded in this session")
+        node_paths = recorder.node_paths
+        starts = []
+        frame_count = 0
+        for ids, frames in chunks:
+            if len(ids) and int(ids.max()) >= len(node_paths):
+                raise ValueError(f"{path} does not match the last recording")
+            starts.append(frame_count)
+            frame_count += len(frames)
+        if frame_count == 0:
+            raise ValueError(f"{path} has no frames")
+
+        self.chunks, self.starts, self.frame_count = chunks, starts, frame_count
+        self.step_size, self.node_paths = step_size, list(node_paths)
+        self.chunk = None
+        self.physics_was_enabled = self.main_app.physics_enabled
+        self.main_app.physics_enabled = False
+        self.playing = True
+        self.elapsed = 0.0
+        self.seek(0)
+
+    def stop(self):
+        if not self.playing:
+            return
+        for index in self.stashed:
+            self.node_paths[index].unstash()
+        for index in self.borrowed:
+            self.node_paths[index].detachNode()
+        self.stashed = set()
+        self.borrowed = set()
+        self.playing = False
+        self.main_app.physics_enabled = self.physics_was_enabled
+        self.chunks = []
+        # Bodies were moved behind physics' back.
+        self.main_app.spatial_index.mark_dirty()
+        self.main_app.occupancy_grid.mark_dirty()
+
+    def show_chunk(self, ids):
+        render = self.main_app.render
+        shown = set(ids.tolist())
+        for index, node_path in enumerate(self.node_paths):
+            if node_path.isEmpty():
+                continue
+            if index in shown:
+                if index in self.stashed:
+                    self.stashed.discard(index)
+                    node_path.unstash()
+                elif not node_path.hasParent():
+                    self.borrowed.add(index)
+                    node_path.reparentTo(render)
+            elif index not in self.stashed and node_path.hasParent():
+                self.stashed.add(index)
+                node_path.stash()
+
+    def seek(self, frame):
+        self.frame = max(0, min(frame, self.frame_count - 1))
+        chunk = bisect.bisect_right(self.starts, self.frame) - 1
+        ids, frames = self.chunks[chunk]
+        if chunk != self.chunk:
+            self.chunk = chunk
+            self.show_chunk(ids)
+        render = self.main_app.render
+        node_paths = self.node_paths
+        for index, row in zip(ids.tolist(), frames[self.frame - self.starts[chunk]].tolist()):
+            node_path = node_paths[index]
+            if node_path.isEmpty():
+                continue
+            node_path.setPosQuat(render, Point3(row[0], row[1], row[2]), Quat(row[3], row[4], row[5], row[6]))
+
+    def scrub(self, frames):
+        if not self.playing:
+            return
+        self.seek(self.frame + frames)
+        self.elapsed = self.frame * self.step_size
+
+    def update(self, dt):
+        if not self.playing:
+            return
+        self.elapsed += dt * self.main_app.stepper.time_scale
+        frame = int(self.elapsed / self.step_size)
+        if frame != self.frame:
+            self.seek(frame)